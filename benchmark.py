@@ -0,0 +1,305 @@
+"""Benchmarks for frame time, physics throughput and render cost
+
+Runs scripted scenarios against the real game code using SDL's dummy video
+driver, so no window or GPU is needed:
+
+    python benchmark.py                       # print timings
+    python benchmark.py --save baseline.json  # store them as a baseline
+    python benchmark.py --baseline baseline.json  # fail on regressions
+"""
+
+import os
+
+# Must be set before pygame creates a display
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import stickman_archery as sa
+
+SEED = 1234               # Seed for every world and scripted input
+MANY_ARROWS = 200         # Arrows kept in flight by the arrow scenario
+CROWD_PLAYERS = 12        # Players in the crowded collision scenario
+CROWD_ARROWS = 1000       # Arrows kept in flight by the crowded collision scenario
+BURST_PARTICLES = 2000    # Particles emitted by the burst scenario
+TERRAIN_LOOKUPS = 1000    # Height lookups timed per terrain sample
+DEFAULT_TOLERANCE = 0.25  # Allowed slowdown of the median before it counts as a regression
+COLD_START_CODE = "import stickman_archery as sa; sa.Game(seed=%d).draw()" % SEED
+
+class Benchmark:
+    """A named piece of code timed repeatedly after some warm-up runs"""
+    
+    def __init__(self, name, setup, samples=300, warmup=20):
+        self.name = name
+        self.setup = setup  # Returns the callable to time
+        self.samples = samples
+        self.warmup = warmup
+    
+    def run(self):
+        """Time the benchmark and return its stats in milliseconds"""
+        operation = self.setup()
+        for _ in range(self.warmup):
+            operation()
+        
+        timings = []
+        clock = time.perf_counter
+        for _ in range(self.samples):
+            start = clock()
+            operation()
+            timings.append((clock() - start) * 1000)
+        return summarize(timings)
+
+def percentile(sorted_values, fraction):
+    """Get a percentile from already sorted values by linear interpolation"""
+    position = (len(sorted_values) - 1) * fraction
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize(timings):
+    """Reduce raw timings to mean and percentiles"""
+    ordered = sorted(timings)
+    return {
+        "mean": sum(ordered) / len(ordered),
+        "p50": percentile(ordered, 0.50),
+        "p90": percentile(ordered, 0.90),
+        "p99": percentile(ordered, 0.99),
+        "max": ordered[-1],
+    }
+
+def spawn_arrows(world, rng, count):
+    """Launch count arrows from random points across the sky"""
+    for _ in range(count):
+        x = rng.uniform(100, sa.SCREEN_WIDTH - 100)
+        y = rng.uniform(50, 250)
+        angle = rng.uniform(-math.pi, 0)
+        power = rng.uniform(5, sa.MAX_POWER)
+        world.arrows.spawn(x, y, power * math.cos(angle), power * math.sin(angle),
+                           rng.randint(1, len(world.players)))
+
+def make_game():
+    """Create a game with a fixed seed"""
+    return sa.Game(seed=SEED)
+
+def many_arrows_world(game=None, player_count=2, arrow_count=MANY_ARROWS):
+    """Set up a world (of game, if given) with arrow_count arrows in flight"""
+    world = game.world if game else sa.World(SEED, player_count)
+    rng = random.Random(SEED)
+    spawn_arrows(world, rng, arrow_count)
+    return world, rng
+
+def make_immortal(world):
+    """Give every player so much health the match never ends"""
+    for player in world.players:
+        player.health = 10 ** 9
+
+def bench_cold_start():
+    """Time a new process importing the game and drawing its first frame"""
+    command = [sys.executable, "-c", COLD_START_CODE]
+    # The game is imported from next to this script, whatever directory it was run from
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return lambda: subprocess.run(command, check=True, cwd=directory)
+
+def bench_restart():
+    """Time restarting a finished match and drawing its first frame"""
+    game = make_game()
+    game.draw()
+    
+    def operation():
+        game.restart_game()
+        game.draw()
+    return operation
+
+def bench_terrain_lookup():
+    """Time TERRAIN_LOOKUPS calls of Terrain.get_height_at_x"""
+    terrain = sa.World(SEED).terrain
+    rng = random.Random(SEED)
+    xs = [rng.uniform(0, sa.SCREEN_WIDTH) for _ in range(TERRAIN_LOOKUPS)]
+    get_height = terrain.get_height_at_x
+    
+    def operation():
+        for x in xs:
+            get_height(x)
+    return operation
+
+def bench_update_arrows(player_count=2, arrow_count=MANY_ARROWS):
+    """Build a setup that times World.update_arrows with arrow_count arrows kept in flight"""
+    def setup():
+        world, rng = many_arrows_world(None, player_count, arrow_count)
+        make_immortal(world)
+        
+        def operation():
+            world.update_arrows()
+            # Keep the batch full so every sample does the same amount of work
+            if len(world.arrows) < arrow_count:
+                spawn_arrows(world, rng, arrow_count - len(world.arrows))
+        return operation
+    return setup
+
+def bench_update_blood_particles():
+    """Time World.update_blood_particles on a large burst"""
+    world = sa.World(SEED)
+    particles = world.blood_particles
+    
+    def operation():
+        if len(particles) < BURST_PARTICLES // 2:
+            particles.emit(600, 300, BURST_PARTICLES - len(particles))
+        world.update_blood_particles()
+    return operation
+
+def bench_world_step():
+    """Time a whole World.step during a busy exchange of shots"""
+    world, rng = many_arrows_world()
+    make_immortal(world)
+    
+    def operation():
+        world.step()
+        if len(world.arrows) < MANY_ARROWS:
+            spawn_arrows(world, rng, MANY_ARROWS - len(world.arrows))
+        if len(world.blood_particles) < 100:
+            world.create_blood_effect(600, 300, True)
+    return operation
+
+def bench_world_step_single():
+    """Time a whole World.step with one arrow in flight, the usual case in headless matches"""
+    world, rng = many_arrows_world(arrow_count=1)
+    make_immortal(world)
+    
+    def operation():
+        world.step()
+        if not world.arrows:
+            spawn_arrows(world, rng, 1)
+    return operation
+
+def bench_draw(method_name, scenario=None):
+    """Build a setup that times one Game draw method under a scenario"""
+    def setup():
+        game = make_game()
+        if scenario is not None:
+            scenario(game)
+        method = getattr(game, method_name)
+        if method_name == "draw_health_bar":
+            return lambda: method(50, 50, game.world.players[0].health, "Player 1")
+        return method
+    return setup
+
+def scenario_busy(game):
+    """Many arrows in flight plus a large particle burst"""
+    many_arrows_world(game)
+    for _ in range(3):
+        game.world.step()
+    game.world.blood_particles.emit(600, 300, BURST_PARTICLES)
+
+def scenario_charging(game):
+    """The current player is halfway through charging a shot"""
+    game.world.start_charging((600, 200))
+    game.world.charge_power = sa.MAX_POWER / 2
+
+def scenario_game_over(game):
+    """Player 1 has won and the overlay is showing"""
+    game.world.players[1].health = 0
+    game.world.check_game_over()
+
+def bench_draw_part(part, scenario):
+    """Build a setup that times drawing one part of the scene directly"""
+    def setup():
+        game = make_game()
+        scenario(game)
+        world = game.world
+        if part == "terrain":
+            return lambda: world.terrain.draw(game.screen)
+        if part == "players":
+            return lambda: [player.draw(game.screen) for player in world.players]
+        if part == "arrows":
+            return lambda: world.arrows.draw(game.screen)
+        return lambda: world.blood_particles.draw(game.screen)
+    return setup
+
+def get_benchmarks():
+    """List every benchmark in a fixed order"""
+    return [
+        Benchmark("startup to first frame (new process)", bench_cold_start, samples=5, warmup=1),
+        Benchmark("Game() with the window open", lambda: make_game, samples=50),
+        Benchmark("game.restart_game + first frame", bench_restart, samples=50),
+        Benchmark("terrain.get_height_at_x x%d" % TERRAIN_LOOKUPS, bench_terrain_lookup),
+        Benchmark("world.update_arrows (%d arrows)" % MANY_ARROWS, bench_update_arrows()),
+        Benchmark("world.update_arrows (crowd)", bench_update_arrows(CROWD_PLAYERS, CROWD_ARROWS)),
+        Benchmark("world.update_arrows (1 arrow)", bench_update_arrows(arrow_count=1)),
+        Benchmark("world.update_blood_particles (burst)", bench_update_blood_particles),
+        Benchmark("world.step (busy)", bench_world_step),
+        Benchmark("world.step (1 arrow)", bench_world_step_single),
+        Benchmark("terrain.draw", bench_draw_part("terrain", scenario_busy), samples=100),
+        Benchmark("player.draw x2", bench_draw_part("players", scenario_busy)),
+        Benchmark("arrows.draw (%d arrows)" % MANY_ARROWS, bench_draw_part("arrows", scenario_busy), samples=100),
+        Benchmark("blood_particles.draw (burst)", bench_draw_part("particles", scenario_busy), samples=100),
+        Benchmark("game.draw_ui", bench_draw("draw_ui", scenario_charging)),
+        Benchmark("game.draw_health_bar", bench_draw("draw_health_bar")),
+        Benchmark("game.draw_wind_indicator", bench_draw("draw_wind_indicator")),
+        Benchmark("game.draw_charging_bar", bench_draw("draw_charging_bar", scenario_charging)),
+        Benchmark("game.draw_game_over", bench_draw("draw_game_over", scenario_game_over)),
+        Benchmark("game.draw (idle)", bench_draw("draw"), samples=100),
+        Benchmark("game.draw (busy)", bench_draw("draw", scenario_busy), samples=100),
+        Benchmark("game.draw (game over)", bench_draw("draw", scenario_game_over), samples=100),
+    ]
+
+def compare(results, baseline, tolerance):
+    """Print the change against a baseline and return the names that regressed"""
+    regressions = []
+    print()
+    print(f"{'benchmark':<42} {'base p50':>9} {'now p50':>9} {'change':>8}")
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<42} {'-':>9} {stats['p50']:>9.4f} {'new':>8}")
+            continue
+        change = stats["p50"] / base["p50"] - 1 if base["p50"] else 0.0
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<42} {base['p50']:>9.4f} {stats['p50']:>9.4f} {change:>+7.0%}{flag}")
+    return regressions
+
+def main():
+    """Run the benchmarks and optionally save or compare against a baseline"""
+    parser = argparse.ArgumentParser(description="Stickman Archery benchmarks")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--save", metavar="PATH", help="write the results to PATH as a baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a baseline saved with --save")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed median slowdown before failing (default: %(default)s)")
+    args = parser.parse_args()
+    
+    results = {}
+    print(f"{'benchmark (ms)':<42} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9}")
+    for benchmark in get_benchmarks():
+        if args.filter not in benchmark.name:
+            continue
+        stats = benchmark.run()
+        results[benchmark.name] = stats
+        print(f"{benchmark.name:<42} {stats['mean']:>9.4f} {stats['p50']:>9.4f} "
+              f"{stats['p90']:>9.4f} {stats['p99']:>9.4f}")
+    
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump({"python": platform.python_version(), "results": results}, baseline_file, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+    
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
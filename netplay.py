@@ -0,0 +1,347 @@
+"""Play Stickman Archery across the network with inputs kept in lockstep
+
+Both players simulate the same seeded World and only exchange each turn's
+shot (turn, angle, power), so a whole match costs a few hundred bytes.
+A small relay server pairs the players and checks the turn order:
+
+    python netplay.py --serve                      # relay on port 5555
+    python netplay.py --connect 192.168.1.10:5555  # each player joins
+    python netplay.py --loopback                   # server and two AI clients in one process
+"""
+
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import asyncio
+import queue
+import random
+import struct
+import threading
+import time
+
+import stickman_archery as sa
+
+DEFAULT_PORT = 5555
+PING_INTERVAL = 1.0       # Seconds between latency measurements
+LATENCY_SMOOTHING = 0.2   # Weight of the newest round trip in the smoothed latency
+
+# Wire format: a type byte followed by a fixed-size body
+MSG_WELCOME = 1  # Server to client: player id and match seed
+MSG_INPUT = 2    # Either way: one turn's input
+MSG_PING = 3     # Client to server: send time, echoed back as MSG_PONG
+MSG_PONG = 4
+MESSAGES = {
+    MSG_WELCOME: struct.Struct("<BBI"),  # type, player id, seed
+    MSG_INPUT: struct.Struct("<BIBBdd"),  # type, turn, action code, arrow type, angle, power
+    MSG_PING: struct.Struct("<Bd"),      # type, client clock
+    MSG_PONG: struct.Struct("<Bd"),
+}
+
+def encode_input(turn, action):
+    """Encode a SHOOT or SKIP action for turn"""
+    code = sa.REPLAY_ACTION_CODES[action.kind]
+    return MESSAGES[MSG_INPUT].pack(MSG_INPUT, turn, code, action.arrow, action.angle, action.power)
+
+def decode_input(message):
+    """Get (turn, Action) from a decoded MSG_INPUT"""
+    _, turn, code, arrow, angle, power = message
+    kind = sa.REPLAY_ACTION_KINDS[code]
+    if kind == sa.SHOOT:
+        return turn, sa.Action(kind, angle=angle, power=power, arrow=arrow)
+    return turn, sa.Action(kind)
+
+async def read_message(reader):
+    """Read one message and return its unpacked fields, starting with the type"""
+    kind = await reader.readexactly(1)
+    message = MESSAGES.get(kind[0])
+    if message is None:
+        raise ConnectionError(f"Unknown message type {kind[0]}")
+    return message.unpack(kind + await reader.readexactly(message.size - 1))
+
+class LockstepMatch:
+    """Two players on a server sharing a seed and the turn order"""
+    
+    def __init__(self, seed):
+        self.seed = seed
+        self.writers = {}  # Player id to stream writer
+        self.turn = 0
+    
+    def accepts(self, player_id, turn):
+        """Check if player_id may send the input for turn"""
+        return len(self.writers) == 2 and turn == self.turn and player_id == 1 + turn % 2
+
+class LockstepServer:
+    """Pairs clients into matches and relays each turn's input to the opponent
+    
+    The server never simulates. It only hands both players the same seed
+    and forwards inputs that are next in the turn order, dropping the rest.
+    """
+    
+    def __init__(self, seed=None):
+        self.seed = seed  # Seed of every match, random per match if None
+        self.lobby = None  # Match waiting for its second player
+        self.server = None
+    
+    async def start(self, host="0.0.0.0", port=DEFAULT_PORT):
+        """Start listening and return the port, which is picked by the OS if port is 0"""
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server.sockets[0].getsockname()[1]
+    
+    def close(self):
+        """Stop accepting connections"""
+        self.server.close()
+    
+    async def handle_client(self, reader, writer):
+        """Serve one client for the length of its match"""
+        match = self.lobby
+        if match is None:
+            seed = self.seed if self.seed is not None else random.randrange(2 ** 32)
+            match = self.lobby = LockstepMatch(seed)
+        player_id = len(match.writers) + 1
+        match.writers[player_id] = writer
+        if player_id == 2:
+            self.lobby = None
+            for other_id, other in match.writers.items():
+                other.write(MESSAGES[MSG_WELCOME].pack(MSG_WELCOME, other_id, match.seed))
+        
+        try:
+            while True:
+                message = await read_message(reader)
+                if message[0] == MSG_PING:
+                    writer.write(MESSAGES[MSG_PONG].pack(MSG_PONG, message[1]))
+                elif message[0] == MSG_INPUT and match.accepts(player_id, message[1]):
+                    match.turn += 1
+                    match.writers[3 - player_id].write(MESSAGES[MSG_INPUT].pack(*message))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            # Either player leaving ends the match
+            if self.lobby is match:
+                self.lobby = None
+            for other in match.writers.values():
+                other.close()
+
+class LockstepClient:
+    """One player's connection to a LockstepServer
+    
+    The connection runs on an asyncio event loop, either the caller's or
+    one on a background thread for the pygame main loop. send_input and
+    get_input may be called from any thread.
+    """
+    
+    def __init__(self):
+        self.player_id = None
+        self.seed = None
+        self.latency = None  # Smoothed round trip time in seconds, None until measured
+        self.connected = False
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.loop = None
+        self.reader = None
+        self.writer = None
+        self.inputs = queue.SimpleQueue()  # (turn, Action) received from the opponent
+        self.pending = {}  # Received inputs by turn, waiting to be applied
+        self.received = None  # Event set on every received input, for asyncio callers
+    
+    async def connect(self, host, port=DEFAULT_PORT):
+        """Connect and wait until the server pairs this client with an opponent"""
+        self.loop = asyncio.get_running_loop()
+        self.received = asyncio.Event()
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        _, self.player_id, self.seed = await self.read()
+        self.connected = True
+    
+    async def read(self):
+        """Read one message, counting its bytes"""
+        message = await read_message(self.reader)
+        self.bytes_received += MESSAGES[message[0]].size
+        return message
+    
+    def write(self, data):
+        """Write data to the server, counting its bytes"""
+        self.bytes_sent += len(data)
+        self.writer.write(data)
+    
+    async def run(self):
+        """Receive the opponent's inputs and measure latency until the connection closes"""
+        pinger = asyncio.create_task(self.ping_forever())
+        try:
+            while True:
+                message = await self.read()
+                if message[0] == MSG_INPUT:
+                    self.inputs.put(decode_input(message))
+                    self.received.set()
+                elif message[0] == MSG_PONG:
+                    round_trip = time.perf_counter() - message[1]
+                    if self.latency is None:
+                        self.latency = round_trip
+                    else:
+                        self.latency += LATENCY_SMOOTHING * (round_trip - self.latency)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            pinger.cancel()
+            self.connected = False
+            self.received.set()
+            self.writer.close()
+    
+    async def ping_forever(self):
+        """Send a ping every PING_INTERVAL seconds"""
+        while True:
+            self.write(MESSAGES[MSG_PING].pack(MSG_PING, time.perf_counter()))
+            await asyncio.sleep(PING_INTERVAL)
+    
+    def send_input(self, turn, action):
+        """Send the local player's input for turn"""
+        self.loop.call_soon_threadsafe(self.write, encode_input(turn, action))
+    
+    def get_input(self, turn):
+        """Get the opponent's input for turn, or None if it hasn't arrived"""
+        while True:
+            try:
+                received_turn, action = self.inputs.get_nowait()
+            except queue.Empty:
+                break
+            self.pending[received_turn] = action
+        return self.pending.pop(turn, None)
+    
+    async def wait_input(self, turn):
+        """Wait for the opponent's input for turn, or None if the connection closed"""
+        while True:
+            action = self.get_input(turn)
+            if action is not None or not self.connected:
+                return action
+            self.received.clear()
+            await self.received.wait()
+    
+    def close(self):
+        """Close the connection from any thread"""
+        if self.writer is not None:
+            self.loop.call_soon_threadsafe(self.writer.close)
+    
+    def start_thread(self, host, port=DEFAULT_PORT):
+        """Connect on a background event loop thread and return once paired"""
+        ready = threading.Event()
+        errors = []
+        
+        async def serve():
+            try:
+                await self.connect(host, port)
+            except (OSError, asyncio.IncompleteReadError) as error:
+                errors.append(error)
+                return
+            finally:
+                ready.set()
+            await self.run()
+        
+        threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+        ready.wait()
+        if errors:
+            raise ConnectionError(f"Could not join a match at {host}:{port}: {errors[0]}")
+
+async def play_headless(client, difficulty="medium", max_turns=200):
+    """Play a networked match without a display, with an AI taking the local turns"""
+    world = sa.World(client.seed)
+    archer = sa.AIArcher(client.player_id, difficulty, random.Random(f"{client.seed}:{client.player_id}"))
+    receiver = asyncio.create_task(client.run())
+    
+    while not world.game_over and world.turn < max_turns:
+        turn = world.turn
+        if world.current_player == client.player_id:
+            world.step([archer.get_action(world)])
+            shot = world.shots[-1]
+            client.send_input(turn, sa.Action(sa.SHOOT, angle=shot.angle, power=shot.power, arrow=shot.arrow))
+        else:
+            action = await client.wait_input(turn)
+            if action is None:
+                break
+            world.step([action])
+        world.run_until_settled()
+    
+    # Let the last input go out before hanging up
+    await asyncio.sleep(0)
+    client.writer.close()
+    await receiver
+    return world
+
+async def play_loopback(seed=None, difficulties=("medium", "medium")):
+    """Run a server and two AI clients over localhost, return both clients' worlds and clients"""
+    server = LockstepServer(seed)
+    port = await server.start("127.0.0.1", 0)
+    clients = [LockstepClient(), LockstepClient()]
+    await asyncio.gather(*(client.connect("127.0.0.1", port) for client in clients))
+    clients.sort(key=lambda client: client.player_id)
+    worlds = await asyncio.gather(*(play_headless(client, difficulty)
+                                    for client, difficulty in zip(clients, difficulties)))
+    server.close()
+    return worlds, clients
+
+def report_loopback(seed, difficulties):
+    """Play a loopback match and print whether both sides stayed in sync"""
+    start = time.perf_counter()
+    worlds, clients = asyncio.run(play_loopback(seed, difficulties))
+    elapsed = time.perf_counter() - start
+    
+    first, second = worlds
+    in_sync = (first.shots == second.shots and first.hits == second.hits and first.winner == second.winner)
+    print(f"Seed {first.seed}: {first.turn} turns in {elapsed:.2f}s, winner {first.winner}")
+    for client in clients:
+        latency = f"{client.latency * 1000:.2f} ms" if client.latency is not None else "not measured"
+        print(f"Player {client.player_id}: sent {client.bytes_sent} bytes, "
+              f"received {client.bytes_received} bytes, ping {latency}")
+    print("Both sides in sync" if in_sync else "DESYNC: the two sides disagree")
+    return in_sync
+
+def parse_address(text):
+    """Parse HOST:PORT, or HOST alone for the default port"""
+    host, _, port = text.rpartition(":")
+    if not host:
+        return port, DEFAULT_PORT
+    return host, int(port)
+
+def main():
+    """Serve, join or test a networked match"""
+    parser = argparse.ArgumentParser(description="Stickman Archery network play")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--serve", action="store_true", help="run the relay server")
+    mode.add_argument("--connect", type=parse_address, metavar="HOST[:PORT]", help="join a match on a server")
+    mode.add_argument("--loopback", action="store_true",
+                      help="play an AI-vs-AI match through a local server and check both sides agree")
+    parser.add_argument("--host", default="0.0.0.0", help="address the server listens on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="server port (default: %(default)s)")
+    parser.add_argument("--seed", type=int, help="seed of every match the server starts")
+    parser.add_argument("--difficulty", nargs=2, default=("medium", "medium"), choices=sorted(sa.AI_DIFFICULTIES),
+                        metavar=("P1", "P2"), help="AI difficulties for --loopback (default: medium medium)")
+    parser.add_argument("--dirty-rects", action="store_true", help="only push changed screen regions")
+    parser.add_argument("--record", metavar="PATH", help="save a replay of the match to PATH")
+    args = parser.parse_args()
+    if args.seed is not None and not 0 <= args.seed < 2 ** 32:
+        parser.error("--seed must be from 0 up to 2**32 - 1")
+    
+    if args.loopback:
+        raise SystemExit(0 if report_loopback(args.seed, tuple(args.difficulty)) else 1)
+    
+    if args.serve:
+        async def serve():
+            server = LockstepServer(args.seed)
+            port = await server.start(args.host, args.port)
+            print(f"Serving matches on {args.host}:{port}")
+            await server.server.serve_forever()
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+        return
+    
+    host, port = args.connect
+    client = LockstepClient()
+    print(f"Waiting for an opponent at {host}:{port}...")
+    client.start_thread(host, port)
+    print(f"Joined as Player {client.player_id}")
+    game = sa.Game(dirty_rects=args.dirty_rects, seed=client.seed, record_path=args.record, network=client)
+    game.run()
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,9 @@ echo ""
 if [ ! -d "game_env" ]; then
     echo "Creating virtual environment..."
     python3 -m venv game_env
-    echo "Installing pygame..."
+    echo "Installing requirements..."
     source game_env/bin/activate
-    pip install pygame
+    pip install -r requirements.txt
 else
     echo "Using existing virtual environment..."
     source game_env/bin/activate
@@ -0,0 +1,263 @@
+"""Columnar log of every shot in many matches, and the tool that aggregates it
+
+Each shot is one row: who shot, angle, power, wind, how many frames it flew,
+where it ended and how much damage it did. Rows are buffered and written in
+blocks that store each column contiguously, so a summary reads only the
+columns it needs, one block at a time, and never holds a whole log in memory:
+
+    python simulate.py --matches 100000 --shot-log shots.bin
+    python shotlog.py shots.bin                   # hit rates and zone shares
+    python shotlog.py shots.bin --wind-step 0.25  # finer wind-vs-accuracy table
+"""
+
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import struct
+
+import numpy as np
+
+import stickman_archery as sa
+
+BLOCK_ROWS = 65536       # Rows buffered before a block is written
+DEFAULT_WIND_STEP = 0.5  # Width of the wind ranges in the accuracy table
+MAX_WIND = 3.0           # Strongest wind World.generate_new_wind blows
+
+# Zone codes, 0 for arrows still in flight when the match ended
+ZONE_CODES = {sa.ZONE_GROUND: 1, sa.ZONE_BODY: 2, sa.ZONE_HEAD: 3, sa.ZONE_LOST: 4, sa.ZONE_BLAST: 5}
+ZONE_NAMES = ("in flight",) + tuple(sorted(ZONE_CODES, key=ZONE_CODES.get))
+HIT_CODES = [ZONE_CODES[sa.ZONE_BODY], ZONE_CODES[sa.ZONE_HEAD], ZONE_CODES[sa.ZONE_BLAST]]  # Shots that hurt someone
+
+# Name and little-endian dtype of every column, in the order each block stores them
+COLUMNS = (
+    ("seed", "<u4"),     # Seed of the match
+    ("turn", "<u2"),     # Shots fired earlier in the match
+    ("shooter", "u1"),
+    ("angle", "<f4"),    # Radians
+    ("power", "<f4"),
+    ("wind", "<f4"),     # Signed wind force the arrow flew in
+    ("arrow", "u1"),     # Index of the arrow type
+    ("frames", "<u2"),   # Steps from launch to landing
+    ("zone", "u1"),      # ZONE_CODES of the landing that did the most damage
+    ("target", "u1"),    # Player that landing hurt, 0 for none
+    ("damage", "<u2"),   # Health all players lost to the shot, split arrows and blasts included
+)
+
+class ShotLog:
+    """Buffered writer of the columnar shot log
+    
+    The file starts with a header (magic, version, metadata length) and the
+    metadata as JSON, which holds the column names and dtypes as well as the
+    settings that produced the shots, so the file describes itself. Each
+    block is then a row count followed by every column's values for those
+    rows, one column after the other.
+    """
+    
+    MAGIC = b"SASL"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBI")
+    BLOCK = struct.Struct("<I")
+    
+    def __init__(self, path, settings=None, block_rows=BLOCK_ROWS):
+        self.file = open(path, "wb")
+        self.block_rows = block_rows
+        self.buffers = {name: np.zeros(block_rows, dtype=dtype) for name, dtype in COLUMNS}
+        self.count = 0  # Buffered rows occupy [0, count)
+        self.rows = 0   # Rows written to the file so far
+        
+        metadata = json.dumps({"columns": [list(column) for column in COLUMNS], "settings": settings or {}},
+                              sort_keys=True).encode()
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION, len(metadata)))
+        self.file.write(metadata)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    @staticmethod
+    def get_rows(world):
+        """Get the world's shots as a dict of column arrays, joined to how each one landed"""
+        shots = world.shots
+        count = len(shots)
+        columns = {name: np.zeros(count, dtype=dtype) for name, dtype in COLUMNS}
+        if not count:
+            return columns
+        
+        columns["seed"][:] = world.seed
+        columns["turn"][:] = np.arange(count)
+        frame, shooter, angle, power, wind, arrow = zip(*shots)
+        fired = np.array(frame)
+        columns["shooter"][:] = shooter
+        columns["angle"][:] = angle
+        columns["power"][:] = power
+        columns["wind"][:] = wind
+        columns["arrow"][:] = arrow
+        
+        # A shot can land several times, when it splits or explodes. Landings are
+        # written least damaging first, so the most damaging one describes the shot.
+        landings = sorted((landing for landing in world.landings if 0 <= landing.shot < count),
+                          key=lambda landing: landing.damage)
+        if landings:
+            frame, shot, zone, target, damage = zip(*landings)
+            shot = np.array(shot)
+            # Arrows are advanced in the step they are fired, so a flight lasts one step more than the frame difference
+            columns["frames"][shot] = np.array(frame) - fired[shot] + 1
+            columns["zone"][shot] = [ZONE_CODES[name] for name in zone]
+            columns["target"][shot] = target
+            np.add.at(columns["damage"], shot, damage)
+        return columns
+    
+    def append(self, columns):
+        """Buffer rows given as a dict of equally long column arrays, writing every block that fills up"""
+        total = len(columns["seed"])
+        done = 0
+        while done < total:
+            take = min(total - done, self.block_rows - self.count)
+            for name, buffer in self.buffers.items():
+                buffer[self.count:self.count + take] = columns[name][done:done + take]
+            self.count += take
+            done += take
+            if self.count == self.block_rows:
+                self.flush()
+    
+    def append_world(self, world):
+        """Buffer every shot of a finished match"""
+        self.append(self.get_rows(world))
+    
+    def flush(self):
+        """Write the buffered rows as one block"""
+        if not self.count:
+            return
+        self.file.write(self.BLOCK.pack(self.count))
+        for buffer in self.buffers.values():
+            self.file.write(buffer[:self.count].tobytes())
+        self.rows += self.count
+        self.count = 0
+    
+    def close(self):
+        """Write the last partial block and close the file"""
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+    
+    @classmethod
+    def read_metadata(cls, log_file):
+        """Read the header of a log opened for reading, leaving the file at its first block"""
+        magic, version, metadata_length = cls.HEADER.unpack(log_file.read(cls.HEADER.size))
+        if magic != cls.MAGIC:
+            raise ValueError("Not a shot log")
+        if version != cls.VERSION:
+            raise ValueError(f"Unsupported shot log version {version}")
+        return json.loads(log_file.read(metadata_length))
+    
+    @classmethod
+    def iter_blocks(cls, path, names=None):
+        """Yield each block as a dict of column arrays, reading only the columns in names (default all)"""
+        with open(path, "rb") as log_file:
+            metadata = cls.read_metadata(log_file)
+            columns = [(name, np.dtype(dtype)) for name, dtype in metadata["columns"]]
+            wanted = set(names) if names is not None else {name for name, _ in columns}
+            while True:
+                header = log_file.read(cls.BLOCK.size)
+                if len(header) < cls.BLOCK.size:
+                    return
+                (rows,) = cls.BLOCK.unpack(header)
+                block = {}
+                for name, dtype in columns:
+                    size = rows * dtype.itemsize
+                    if name in wanted:
+                        block[name] = np.frombuffer(log_file.read(size), dtype=dtype)
+                    else:
+                        log_file.seek(size, os.SEEK_CUR)  # Skip columns nobody asked for
+                yield block
+
+def summarize(path, wind_step=DEFAULT_WIND_STEP):
+    """Print hit rates, zone shares, a wind-vs-accuracy table and, if logged, a table by arrow type"""
+    with open(path, "rb") as log_file:
+        settings = ShotLog.read_metadata(log_file)["settings"]
+    if settings:
+        print("settings:", ", ".join(f"{name}={value}" for name, value in sorted(settings.items())))
+    
+    # Running totals stay the same size however many shots the log holds
+    bins = int(np.ceil(2 * MAX_WIND / wind_step))
+    zones = np.zeros(len(ZONE_NAMES), dtype=np.int64)
+    wind_shots = np.zeros((bins, len(ZONE_NAMES)), dtype=np.int64)
+    shooter_shots = np.zeros(sa.MAX_PLAYERS + 1, dtype=np.int64)
+    shooter_hits = np.zeros(sa.MAX_PLAYERS + 1, dtype=np.int64)
+    arrow_shots = np.zeros(256, dtype=np.int64)
+    arrow_hits = np.zeros(256, dtype=np.int64)
+    arrow_damage = np.zeros(256, dtype=np.int64)
+    flight_frames = 0
+    damage = 0
+    for block in ShotLog.iter_blocks(path, ("shooter", "wind", "arrow", "frames", "zone", "damage")):
+        zone = block["zone"]
+        hit = np.isin(zone, HIT_CODES)
+        zones += np.bincount(zone, minlength=len(ZONE_NAMES))
+        wind_bin = np.clip(((block["wind"] + MAX_WIND) / wind_step).astype(np.intp), 0, bins - 1)
+        np.add.at(wind_shots, (wind_bin, zone), 1)
+        shooter_shots += np.bincount(block["shooter"], minlength=len(shooter_shots))
+        shooter_hits += np.bincount(block["shooter"], weights=hit, minlength=len(shooter_hits)).astype(np.int64)
+        flight_frames += int(block["frames"].sum(dtype=np.int64))
+        damage += int(block["damage"].sum(dtype=np.int64))
+        if "arrow" in block:
+            arrow_shots += np.bincount(block["arrow"], minlength=len(arrow_shots))
+            arrow_hits += np.bincount(block["arrow"], weights=hit, minlength=len(arrow_hits)).astype(np.int64)
+            arrow_damage += np.bincount(block["arrow"], weights=block["damage"],
+                                        minlength=len(arrow_damage)).astype(np.int64)
+    
+    shots = int(zones.sum())
+    if not shots:
+        print("no shots")
+        return
+    hits = int(zones[HIT_CODES].sum())
+    landed = shots - int(zones[0])
+    print(f"shots: {shots}")
+    print(f"hit rate: {hits / shots:.1%}")
+    print(f"headshots: {zones[ZONE_CODES[sa.ZONE_HEAD]] / hits:.1%} of hits" if hits else "headshots: no hits")
+    print(f"average flight: {flight_frames / landed:.1f} frames" if landed else "average flight: no landings")
+    print(f"average damage: {damage / shots:.1f} per shot")
+    print("zones: " + ", ".join(f"{name} {count / shots:.1%}" for name, count in zip(ZONE_NAMES, zones.tolist())))
+    for player in np.flatnonzero(shooter_shots).tolist():
+        print(f"player {player} hit rate: {shooter_hits[player] / shooter_shots[player]:.1%} "
+              f"of {shooter_shots[player]} shots")
+    
+    print()
+    print(f"{'wind':>13} {'shots':>9} {'hit rate':>9} {'head':>7} {'ground':>7} {'lost':>7}")
+    for index, row in enumerate(wind_shots.tolist()):
+        total = sum(row)
+        if not total:
+            continue
+        low = index * wind_step - MAX_WIND
+        shares = [row[ZONE_CODES[zone]] / total for zone in (sa.ZONE_HEAD, sa.ZONE_GROUND, sa.ZONE_LOST)]
+        hit_rate = sum(row[code] for code in HIT_CODES) / total
+        print(f"{low:+6.2f}..{low + wind_step:+5.2f} {total:9d} {hit_rate:9.1%} "
+              + " ".join(f"{share:7.1%}" for share in shares))
+    
+    names = settings.get("arrow_types", [])
+    if arrow_shots.any():
+        print()
+        print(f"{'arrow':>13} {'shots':>9} {'hit rate':>9} {'damage':>7}")
+        for arrow in np.flatnonzero(arrow_shots).tolist():
+            name = names[arrow] if arrow < len(names) else str(arrow)
+            print(f"{name:>13} {arrow_shots[arrow]:9d} {arrow_hits[arrow] / arrow_shots[arrow]:9.1%} "
+                  f"{arrow_damage[arrow] / arrow_shots[arrow]:7.1f}")
+
+def main():
+    """Summarize a shot log"""
+    parser = argparse.ArgumentParser(description="Stickman Archery shot log summary")
+    parser.add_argument("path", help="shot log written by simulate.py --shot-log")
+    parser.add_argument("--wind-step", type=float, default=DEFAULT_WIND_STEP,
+                        help="width of the wind ranges in the accuracy table (default: %(default)s)")
+    args = parser.parse_args()
+    if args.wind_step <= 0:
+        parser.error("--wind-step must be positive")
+    summarize(args.path, args.wind_step)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Play many seeded AI-vs-AI matches in parallel for balancing the game rules
+
+Matches run headlessly across a process pool and every result is streamed
+to a compact binary file as it arrives:
+
+    python simulate.py --matches 10000 --output results.bin
+    python simulate.py --matches 10000 --set HEAD_DAMAGE=40 --set GRAVITY=0.45
+    python simulate.py --summary results.bin   # summarize an existing file
+    python simulate.py --matches 100000 --shot-log shots.bin  # also log every shot, see shotlog.py
+    python simulate.py --matches 10000 --arrow heavy          # archers shoot one of arrow_types.json
+"""
+
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import multiprocessing
+import struct
+import sys
+import time
+
+import shotlog
+import stickman_archery as sa
+
+TUNABLE = ("BODY_DAMAGE", "HEAD_DAMAGE", "GRAVITY", "MAX_POWER")  # Constants --set may override
+DEFAULT_MATCHES = 1000
+DEFAULT_SEED = 1
+CHUNK_SIZE = 8  # Matches handed to a worker at a time, amortizing the round trip
+
+class MatchLog:
+    """Binary file of match results
+    
+    The file starts with a header (magic, version, settings length) and the
+    settings as JSON, so results always say which rules produced them. Each
+    match is then a record of seed, winner (0 for none), shot count and hit
+    count, followed by one record per shot (shooter, angle, power,
+    wind) and one per hit (shooter, headshot flag, x, y).
+    """
+    
+    MAGIC = b"SABM"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBI")
+    MATCH = struct.Struct("<IBHH")
+    SHOT = struct.Struct("<Bfff")
+    HIT = struct.Struct("<B?hh")
+    
+    @classmethod
+    def pack_match(cls, world):
+        """Encode one finished match as bytes"""
+        parts = [cls.MATCH.pack(world.seed, world.winner or 0, len(world.shots), len(world.hits))]
+        parts.extend(cls.SHOT.pack(shot.shooter, shot.angle, shot.power, shot.wind) for shot in world.shots)
+        parts.extend(cls.HIT.pack(hit.shooter, hit.headshot, round(hit.x), round(hit.y)) for hit in world.hits)
+        return b"".join(parts)
+    
+    @classmethod
+    def write_header(cls, log_file, settings):
+        """Write the header and settings to a newly opened file"""
+        settings_bytes = json.dumps(settings, sort_keys=True).encode()
+        log_file.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(settings_bytes)))
+        log_file.write(settings_bytes)
+    
+    @classmethod
+    def read(cls, path):
+        """Load a file and return (settings, list of match dicts)"""
+        with open(path, "rb") as log_file:
+            data = log_file.read()
+        
+        magic, version, settings_length = cls.HEADER.unpack_from(data, 0)
+        if magic != cls.MAGIC:
+            raise ValueError("Not a match results file")
+        if version != cls.VERSION:
+            raise ValueError(f"Unsupported results version {version}")
+        offset = cls.HEADER.size
+        settings = json.loads(data[offset:offset + settings_length])
+        offset += settings_length
+        
+        matches = []
+        while offset < len(data):
+            seed, winner, shot_count, hit_count = cls.MATCH.unpack_from(data, offset)
+            offset += cls.MATCH.size
+            shots = list(cls.SHOT.iter_unpack(data[offset:offset + shot_count * cls.SHOT.size]))
+            offset += shot_count * cls.SHOT.size
+            hits = list(cls.HIT.iter_unpack(data[offset:offset + hit_count * cls.HIT.size]))
+            offset += hit_count * cls.HIT.size
+            matches.append({"seed": seed, "winner": winner or None, "shots": shots, "hits": hits})
+        return settings, matches
+
+def init_worker(overrides):
+    """Apply constant overrides in a worker before it plays any match"""
+    for name, value in overrides.items():
+        setattr(sa, name, value)
+
+def play_match(job):
+    """Play one seeded match and return it encoded, so the parent only writes bytes"""
+    seed, difficulties, arrow, log_shots = job
+    world = sa.self_play(seed, difficulties, arrow=arrow)
+    shot_rows = shotlog.ShotLog.get_rows(world) if log_shots else None
+    return world.winner, MatchLog.pack_match(world), shot_rows
+
+def parse_override(text):
+    """Parse NAME=VALUE into a (name, number) pair for --set"""
+    name, _, value = text.partition("=")
+    name = name.strip().upper()
+    if name not in TUNABLE:
+        raise argparse.ArgumentTypeError(f"{name} is not one of {', '.join(TUNABLE)}")
+    try:
+        return name, type(getattr(sa, name))(value)
+    except ValueError:
+        return name, float(value)
+
+def run(matches, seed, difficulties, overrides, output, workers, shot_log_path=None, arrow=None):
+    """Play matches across a pool and stream them to output, and every shot to shot_log_path if given
+    
+    Archers shoot the arrow type called arrow, the first type if None.
+    Returns the win counts.
+    """
+    settings = {name: getattr(sa, name) for name in TUNABLE}
+    settings.update(overrides)
+    arrow_types = sa.ArrowTypes.load()
+    arrow = arrow or arrow_types[0].name
+    settings.update({"seed": seed, "difficulties": list(difficulties), "arrow": arrow,
+                     "arrow_types": arrow_types.get_names()})
+    
+    wins = {None: 0, 1: 0, 2: 0}
+    log_shots = shot_log_path is not None
+    arrow_index = arrow_types.index(arrow)
+    jobs = (((seed + index) % 2 ** 32, difficulties, arrow_index, log_shots) for index in range(matches))
+    shot_log = shotlog.ShotLog(shot_log_path, settings) if log_shots else None
+    with open(output, "wb") as log_file, multiprocessing.Pool(workers, init_worker, (overrides,)) as pool:
+        MatchLog.write_header(log_file, settings)
+        for done, (winner, record, shot_rows) in enumerate(pool.imap_unordered(play_match, jobs, CHUNK_SIZE), 1):
+            log_file.write(record)
+            if shot_log is not None:
+                shot_log.append(shot_rows)
+            wins[winner] += 1
+            if done % 100 == 0 or done == matches:
+                print(f"\r{done}/{matches} matches", end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    if shot_log is not None:
+        shot_log.close()
+    return wins
+
+def summarize(path):
+    """Print win rates and hit statistics for a results file"""
+    settings, matches = MatchLog.read(path)
+    print("settings:", ", ".join(f"{name}={value}" for name, value in sorted(settings.items())))
+    if not matches:
+        print("no matches")
+        return
+    
+    shots = sum(len(match["shots"]) for match in matches)
+    hits = [hit for match in matches for hit in match["hits"]]
+    headshots = sum(1 for hit in hits if hit[1])
+    print(f"matches: {len(matches)}")
+    for player in (1, 2):
+        player_wins = sum(1 for match in matches if match["winner"] == player)
+        print(f"player {player} wins: {player_wins / len(matches):.1%}")
+    print(f"unfinished: {sum(1 for match in matches if match['winner'] is None) / len(matches):.1%}")
+    print(f"average shots: {shots / len(matches):.1f}")
+    print(f"hit rate: {len(hits) / shots:.1%} of {shots} shots" if shots else "hit rate: no shots")
+    print(f"headshots: {headshots / len(hits):.1%} of hits" if hits else "headshots: no hits")
+
+def main():
+    """Run a batch of matches or summarize a previous one"""
+    parser = argparse.ArgumentParser(description="Stickman Archery batch match runner")
+    parser.add_argument("--matches", type=int, default=DEFAULT_MATCHES,
+                        help="number of matches to play (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED,
+                        help="seed of the first match, later matches count up from it (default: %(default)s)")
+    parser.add_argument("--difficulty", nargs=2, default=("medium", "medium"), choices=sorted(sa.AI_DIFFICULTIES),
+                        metavar=("P1", "P2"), help="AI difficulty of each player (default: medium medium)")
+    parser.add_argument("--set", type=parse_override, action="append", default=[], metavar="NAME=VALUE",
+                        help="override one of %s for every match" % ", ".join(TUNABLE))
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--output", default="results.bin", help="results file (default: %(default)s)")
+    parser.add_argument("--arrow", choices=sa.ArrowTypes.load().get_names(),
+                        help="arrow type every archer shoots (default: the first in arrow_types.json)")
+    parser.add_argument("--shot-log", metavar="PATH",
+                        help="also write every shot to a columnar log at PATH, summarized by shotlog.py")
+    parser.add_argument("--summary", metavar="PATH", help="summarize an existing results file and exit")
+    args = parser.parse_args()
+    
+    if args.summary:
+        summarize(args.summary)
+        return
+    
+    start = time.perf_counter()
+    run(args.matches, args.seed, tuple(args.difficulty), dict(args.set), args.output, args.workers, args.shot_log,
+        args.arrow)
+    elapsed = time.perf_counter() - start
+    print(f"Played {args.matches} matches in {elapsed:.1f}s ({args.matches / elapsed:.1f} matches/s)")
+    summarize(args.output)
+    if args.shot_log:
+        print()
+        shotlog.summarize(args.shot_log)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+"""Broadcast matches to spectators as a stream of compressed state snapshots
+
+A broadcaster plays or replays a match and encodes its state once per step,
+as a keyframe every KEYFRAME_INTERVAL steps and as a delta against the
+previous step in between. Every encoded frame is sent as is to all viewers,
+so one match can feed hundreds of spectators for little more than the cost
+of copying bytes:
+
+    python spectate.py --broadcast                        # live AI-vs-AI match on port 5556
+    python spectate.py --broadcast --replay match.bin     # a recorded match
+    python spectate.py --broadcast --difficulty easy medium hard hard --teams 2  # two teams of two
+    python spectate.py --watch localhost:5556             # open a viewer window
+    python spectate.py --watch localhost:5556 --headless  # decode without a display
+"""
+
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import asyncio
+import random
+import socket
+import struct
+import time
+import zlib
+
+import numpy as np
+
+import stickman_archery as sa
+
+DEFAULT_PORT = 5556
+KEYFRAME_INTERVAL = 180          # Steps between keyframes, the longest a new viewer waits
+MAX_VIEWER_BACKLOG = 256 * 1024  # Bytes queued for a viewer before it skips to the next keyframe
+END_LINGER = 3.0                 # Seconds the broadcast stays up after the match ends
+CLOSE_TIMEOUT = 2.0              # Seconds to wait for viewers to hang up after the broadcast
+
+# Snapshot values are fixed point, so deltas are exact and compress well
+POSITION_SCALE = 8     # Steps per pixel
+VELOCITY_SCALE = 256   # Steps per pixel per frame
+WIND_SCALE = 1000
+POWER_SCALE = 100
+
+# Stream format: a header, then records of kind, frame and zlib payload
+STREAM_MAGIC = b"SASS"
+STREAM_VERSION = 3
+HEADER = struct.Struct("<4sBIBB")  # magic, version, world seed, player count, team count or 0
+RECORD = struct.Struct("<BII")    # kind, frame, payload length
+COUNTS = struct.Struct("<HH")     # arrows, craters in the payload
+KEYFRAME = 1
+DELTA = 2
+WORLD_FIELDS = 7   # Current player, turn, wind, charging, charge power, game over, winner
+PLAYER_FIELDS = 4  # x, y, health, facing right
+ARROW_FIELDS = 6   # x, y, velocity x, velocity y, shooter, arrow type
+
+def quantize_state(world):
+    """Get the world's state as fixed point (scalars, arrow ids, arrow fields)"""
+    scalars = [world.current_player, world.turn, round(world.get_wind_force() * WIND_SCALE), world.charging,
+               round(world.charge_power * POWER_SCALE), world.game_over, world.winner or 0]
+    for player in world.players:
+        scalars += [round(player.x * POSITION_SCALE), round(player.y * POSITION_SCALE),
+                    player.health, player.facing_right]
+    
+    arrows = world.arrows
+    n = arrows.count
+    fields = np.column_stack((arrows.x[:n] * POSITION_SCALE, arrows.y[:n] * POSITION_SCALE,
+                              arrows.velocity_x[:n] * VELOCITY_SCALE, arrows.velocity_y[:n] * VELOCITY_SCALE,
+                              arrows.shooter[:n], arrows.kind[:n]))
+    return np.array(scalars, dtype=np.int32), arrows.ids[:n].copy(), np.rint(fields).astype(np.int32)
+
+def match_ids(ids, previous_ids):
+    """Get which arrows were present before and, for those, their previous rows"""
+    same = ids[:, None] == previous_ids[None, :]
+    known = same.any(axis=1)
+    if not len(previous_ids):
+        return known, np.zeros(0, dtype=int)
+    return known, same.argmax(axis=1)[known]
+
+def get_base_fields(ids, previous_ids, previous_fields):
+    """Get each arrow's fields from the previous frame, zero for arrows new since then"""
+    known, rows = match_ids(ids, previous_ids)
+    base = np.zeros((len(ids), ARROW_FIELDS), dtype=np.int32)
+    base[known] = previous_fields[rows]
+    return base
+
+class SnapshotEncoder:
+    """Encodes a world once per step as a keyframe or a delta against the last step
+    
+    Arrows are matched between steps by id. A step where nothing changed
+    is an empty record.
+    """
+    
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.encoded = 0
+        self.scalars = None
+        self.ids = np.zeros(0, dtype=np.int32)
+        self.fields = np.zeros((0, ARROW_FIELDS), dtype=np.int32)
+        self.crater_count = 0
+    
+    def encode(self, world):
+        """Encode the world's current state as one stream record"""
+        scalars, ids, fields = quantize_state(world)
+        craters = world.terrain.craters
+        keyframe = self.encoded % self.keyframe_interval == 0
+        self.encoded += 1
+        
+        if keyframe:
+            scalar_delta = scalars
+            field_delta = fields
+            new_craters = craters
+        else:
+            scalar_delta = scalars - self.scalars
+            field_delta = fields - get_base_fields(ids, self.ids, self.fields)
+            new_craters = craters[self.crater_count:]
+        unchanged = (not keyframe and not scalar_delta.any() and not field_delta.any()
+                     and not new_craters and np.array_equal(ids, self.ids))
+        
+        self.scalars = scalars
+        self.ids = ids
+        self.fields = fields
+        self.crater_count = len(craters)
+        if unchanged:
+            return RECORD.pack(DELTA, world.frame, 0)
+        
+        payload = zlib.compress(b"".join((
+            COUNTS.pack(len(ids), len(new_craters)),
+            scalar_delta.tobytes(),
+            ids.tobytes(),
+            field_delta.tobytes(),
+            np.array(new_craters, dtype=np.float64).tobytes(),
+        )))
+        return RECORD.pack(KEYFRAME if keyframe else DELTA, world.frame, len(payload)) + payload
+
+class SnapshotDecoder:
+    """Rebuilds the state a SnapshotEncoder encoded and shows it in a world"""
+    
+    def __init__(self, player_count):
+        self.scalar_count = WORLD_FIELDS + PLAYER_FIELDS * player_count
+        self.frame = 0
+        self.scalars = None  # None until the first keyframe
+        self.ids = np.zeros(0, dtype=np.int32)
+        self.fields = np.zeros((0, ARROW_FIELDS), dtype=np.int32)
+        self.craters = []  # Every crater so far as (x, y, radius)
+    
+    def decode(self, kind, frame, payload):
+        """Apply one record, return False if it must wait for a keyframe"""
+        if kind == DELTA and self.scalars is None:
+            return False
+        self.frame = frame
+        if not payload:
+            return True
+        
+        data = zlib.decompress(payload)
+        arrow_count, crater_count = COUNTS.unpack_from(data)
+        offset = COUNTS.size
+        scalars = np.frombuffer(data, np.int32, self.scalar_count, offset)
+        offset += scalars.nbytes
+        ids = np.frombuffer(data, np.int32, arrow_count, offset)
+        offset += ids.nbytes
+        fields = np.frombuffer(data, np.int32, arrow_count * ARROW_FIELDS, offset).reshape(-1, ARROW_FIELDS)
+        offset += fields.nbytes
+        craters = np.frombuffer(data, np.float64, crater_count * 3, offset).reshape(-1, 3).tolist()
+        
+        if kind == KEYFRAME:
+            self.scalars = scalars.copy()
+            self.fields = fields.copy()
+            self.craters = craters
+        else:
+            self.scalars = self.scalars + scalars
+            self.fields = fields + get_base_fields(ids, self.ids, self.fields)
+            self.craters.extend(craters)
+        self.ids = ids.copy()
+        return True
+    
+    def apply(self, world):
+        """Show the decoded state in a world created from the stream's seed"""
+        scalars = self.scalars.tolist()
+        world.frame = self.frame
+        world.current_player, world.turn, wind, charging, charge_power, game_over, winner = scalars[:WORLD_FIELDS]
+        world.wind_strength = abs(wind) / WIND_SCALE
+        world.wind_direction = -1 if wind < 0 else 1
+        world.charging = bool(charging)
+        world.charge_power = charge_power / POWER_SCALE
+        world.game_over = bool(game_over)
+        world.winner = winner or None
+        
+        for index, player in enumerate(world.players):
+            start = WORLD_FIELDS + index * PLAYER_FIELDS
+            x, y, health, facing_right = scalars[start:start + PLAYER_FIELDS]
+            player.x = x / POSITION_SCALE
+            player.y = y / POSITION_SCALE
+            player.facing_right = bool(facing_right)
+            # Spectators see blood wherever a player loses health
+            if health < player.health:
+                headshot = player.health - health >= sa.HEAD_DAMAGE
+                world.create_blood_effect(player.x, player.y - (40 if headshot else 20), headshot)
+            player.health = health
+        
+        # Arrows already on screen keep their trails, new ones start without
+        arrows = world.arrows
+        known, rows = match_ids(self.ids, arrows.ids[:arrows.count])
+        arrows.select(rows)
+        arrows.record_trails()
+        n = arrows.count
+        known_fields = self.fields[known]
+        arrows.x[:n] = known_fields[:, 0] / POSITION_SCALE
+        arrows.y[:n] = known_fields[:, 1] / POSITION_SCALE
+        arrows.velocity_x[:n] = known_fields[:, 2] / VELOCITY_SCALE
+        arrows.velocity_y[:n] = known_fields[:, 3] / VELOCITY_SCALE
+        for arrow_id, (x, y, velocity_x, velocity_y, shooter, kind) in zip(self.ids[~known].tolist(),
+                                                                          self.fields[~known].tolist()):
+            arrows.spawn(x / POSITION_SCALE, y / POSITION_SCALE,
+                         velocity_x / VELOCITY_SCALE, velocity_y / VELOCITY_SCALE, shooter, kind=kind)
+            arrows.ids[arrows.count - 1] = arrow_id
+        
+        for x, y, radius in self.craters[len(world.terrain.craters):]:
+            world.terrain.carve(x, y, radius)
+
+class SpectatorServer:
+    """Sends every encoded frame to all connected viewers
+    
+    A viewer joining mid-match first gets the stream header, the latest
+    keyframe and the deltas since. A viewer that falls behind skips ahead
+    to the next keyframe rather than slowing the broadcast down.
+    """
+    
+    def __init__(self, seed, player_count=2, team_count=None):
+        self.header = HEADER.pack(STREAM_MAGIC, STREAM_VERSION, seed, player_count, team_count or 0)
+        self.viewers = {}  # Writer of each viewer to whether it waits for a keyframe
+        self.since_keyframe = []  # Records from the latest keyframe on
+        self.server = None
+    
+    async def start(self, host="0.0.0.0", port=DEFAULT_PORT):
+        """Start listening and return the port, which is picked by the OS if port is 0"""
+        self.server = await asyncio.start_server(self.handle_viewer, host, port)
+        return self.server.sockets[0].getsockname()[1]
+    
+    async def close(self):
+        """Stop accepting viewers, end the stream and wait for the viewers to hang up"""
+        self.server.close()
+        for writer in self.viewers:
+            writer.close()
+        deadline = asyncio.get_running_loop().time() + CLOSE_TIMEOUT
+        while self.viewers and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.05)
+    
+    async def handle_viewer(self, reader, writer):
+        """Catch a new viewer up, then keep it until it disconnects"""
+        writer.write(self.header + b"".join(self.since_keyframe))
+        self.viewers[writer] = False
+        try:
+            await reader.read()  # Viewers never send anything, so this returns when they leave
+        except ConnectionError:
+            pass
+        finally:
+            self.viewers.pop(writer, None)
+            writer.close()
+    
+    def broadcast(self, record):
+        """Send one encoded frame to every viewer"""
+        keyframe = record[0] == KEYFRAME
+        if keyframe:
+            self.since_keyframe = [record]
+        else:
+            self.since_keyframe.append(record)
+        
+        for writer, waiting in list(self.viewers.items()):
+            if waiting and not keyframe:
+                continue
+            lagging = writer.transport.get_write_buffer_size() > MAX_VIEWER_BACKLOG
+            self.viewers[writer] = lagging
+            if not lagging:
+                writer.write(record)
+
+def make_ai_driver(world, difficulties):
+    """Get a function giving each step's actions for an AI-vs-AI match, pausing like the game does"""
+    archers = {player_id: sa.AIArcher(player_id, difficulty, random.Random(f"{world.seed}:{player_id}"))
+               for player_id, difficulty in enumerate(difficulties, 1)}
+    wait = 0
+    
+    def get_actions(world):
+        nonlocal wait
+        if not world.is_settled() or world.game_over:
+            return ()
+        wait += 1
+        if wait < sa.AI_THINK_FRAMES:
+            return ()
+        wait = 0
+        return [archers[world.current_player].get_action(world)]
+    return get_actions
+
+async def broadcast_match(server, world, get_actions, end_frame=None):
+    """Step the world in real time, broadcasting every step, until the match ends"""
+    loop = asyncio.get_running_loop()
+    encoder = SnapshotEncoder()
+    next_time = loop.time()
+    records = keyframes = stream_bytes = 0
+    while not world.game_over and (end_frame is None or world.frame < end_frame):
+        world.step(get_actions(world))
+        record = encoder.encode(world)
+        server.broadcast(record)
+        records += 1
+        keyframes += record[0] == KEYFRAME
+        stream_bytes += len(record)
+        
+        next_time += sa.SIM_STEP
+        await asyncio.sleep(max(0.0, next_time - loop.time()))
+    
+    print(f"Broadcast {records} frames ({keyframes} keyframes) in {stream_bytes} bytes, "
+          f"{stream_bytes / max(records, 1):.1f} bytes per frame, winner {world.winner}")
+    await asyncio.sleep(END_LINGER)
+
+async def serve_broadcast(host, port, replay=None, seed=None, difficulties=("medium", "medium"), team_count=None):
+    """Broadcast one match, a replay if given or else a live match between AIs of the given difficulties"""
+    if replay is not None:
+        world = replay.create_world()
+        get_actions = lambda world: replay.actions_at(world.frame)
+        end_frame = replay.end_frame
+    else:
+        world = sa.World(seed, len(difficulties), team_count)
+        get_actions = make_ai_driver(world, difficulties)
+        end_frame = None
+    
+    server = SpectatorServer(world.seed, len(world.players), world.team_count)
+    port = await server.start(host, port)
+    print(f"Broadcasting seed {world.seed} on {host}:{port}")
+    await broadcast_match(server, world, get_actions, end_frame)
+    await server.close()
+
+class Viewer:
+    """Follows a broadcast, showing it with the game's own drawing code
+    
+    A headless viewer only decodes the stream into a world, for load tests.
+    """
+    
+    def __init__(self, host, port=DEFAULT_PORT, headless=False):
+        self.socket = socket.create_connection((host, port))
+        header = b""
+        while len(header) < HEADER.size:
+            chunk = self.socket.recv(HEADER.size - len(header))
+            if not chunk:
+                raise ConnectionError("The broadcast ended before it started")
+            header += chunk
+        magic, version, seed, player_count, team_count = HEADER.unpack(header)
+        if magic != STREAM_MAGIC or version != STREAM_VERSION:
+            raise ValueError("Not a stickman archery broadcast (version %d)" % STREAM_VERSION)
+        
+        self.decoder = SnapshotDecoder(player_count)
+        self.buffer = bytearray()
+        self.frames = 0
+        self.bytes_received = HEADER.size
+        self.headless = headless
+        if headless:
+            self.game = None
+            self.world = sa.World(seed, player_count, team_count or None)
+        else:
+            self.socket.setblocking(False)
+            self.game = sa.Game(seed=seed, player_count=player_count, team_count=team_count or None)
+            self.world = self.game.world
+            sa.pygame.display.set_caption("Stickman Archery Game - Spectating")
+    
+    def receive(self):
+        """Decode every complete record that has arrived, return False once the broadcast ended"""
+        try:
+            data = self.socket.recv(65536)
+        except BlockingIOError:
+            return True
+        if not data:
+            self.socket.close()
+            return False
+        self.bytes_received += len(data)
+        buffer = self.buffer
+        buffer += data
+        
+        while len(buffer) >= RECORD.size:
+            kind, frame, length = RECORD.unpack_from(buffer)
+            end = RECORD.size + length
+            if len(buffer) < end:
+                break
+            if self.decoder.decode(kind, frame, bytes(buffer[RECORD.size:end])):
+                self.decoder.apply(self.world)
+                self.world.update_blood_particles()
+                if self.game is not None:
+                    self.game.camera.follow(self.world)
+                self.frames += 1
+            del buffer[:end]
+        return True
+    
+    def run(self):
+        """Show the broadcast until it ends (headless) or the window is closed"""
+        start = time.perf_counter()
+        if self.headless:
+            while self.receive():
+                pass
+            elapsed = time.perf_counter() - start
+            print(f"Decoded {self.frames} frames from {self.bytes_received} bytes in {elapsed:.1f}s, "
+                  f"winner {self.world.winner}")
+            return
+        
+        game = self.game
+        live = True
+        while True:
+            if any(event.type == sa.pygame.QUIT for event in sa.pygame.event.get()):
+                break
+            if live:
+                live = self.receive()
+            game.draw()
+            game.clock.tick(sa.FPS)
+        sa.pygame.quit()
+
+def parse_address(text):
+    """Parse HOST:PORT, or HOST alone for the default port"""
+    host, _, port = text.rpartition(":")
+    if not host:
+        return port, DEFAULT_PORT
+    return host, int(port)
+
+def main():
+    """Broadcast a match or watch one"""
+    parser = argparse.ArgumentParser(description="Stickman Archery spectator broadcasts")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--broadcast", action="store_true", help="broadcast a match to viewers")
+    mode.add_argument("--watch", type=parse_address, metavar="HOST[:PORT]", help="watch a broadcast")
+    parser.add_argument("--host", default="0.0.0.0", help="address to broadcast on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="broadcast port (default: %(default)s)")
+    parser.add_argument("--replay", metavar="PATH", help="broadcast a recorded match instead of a live one")
+    parser.add_argument("--seed", type=int, help="seed of the live AI-vs-AI match")
+    parser.add_argument("--difficulty", nargs="+", default=("medium", "medium"), choices=sorted(sa.AI_DIFFICULTIES),
+                        metavar="LEVEL", help="AI difficulty of each player in the live match (default: medium medium)")
+    parser.add_argument("--teams", type=int, metavar="N", help="split the live match's players into N teams")
+    parser.add_argument("--headless", action="store_true", help="with --watch, decode without opening a window")
+    args = parser.parse_args()
+    if args.seed is not None and not 0 <= args.seed < 2 ** 32:
+        parser.error("--seed must be from 0 up to 2**32 - 1")
+    
+    if args.watch:
+        host, port = args.watch
+        Viewer(host, port, args.headless).run()
+        return
+    
+    replay = sa.Replay.load(args.replay) if args.replay else None
+    try:
+        asyncio.run(serve_broadcast(args.host, args.port, replay, args.seed, tuple(args.difficulty), args.teams))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
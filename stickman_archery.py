@@ -1,15 +1,22 @@
+import numpy as np
 import pygame
+import argparse
+import csv
+import json
 import math
+import os
 import random
+import struct
 import sys
-
-# Initialize Pygame
-pygame.init()
+import time
+from collections import OrderedDict, deque, namedtuple
 
 # Game Constants
 SCREEN_WIDTH = 1200
 SCREEN_HEIGHT = 700
 FPS = 60
+SIM_STEP = 1.0 / 60     # Seconds of game time per simulation step
+MAX_FRAME_TIME = 0.25   # Longest frame the simulation will catch up on
 
 # Colors
 WHITE = (255, 255, 255)
@@ -28,58 +35,301 @@ BODY_DAMAGE = 25
 HEAD_DAMAGE = 50
 GRAVITY = 0.5
 MAX_POWER = 20
+MAX_PLAYERS = 12    # Most archers in one match
+PLAYER_MARGIN = 150  # Distance of the outermost archers from the screen edges
+
+# Terrain Constants
+TERRAIN_SPACING = 50       # Horizontal distance between generated terrain points
+TERRAIN_CHUNK_POINTS = 12  # Terrain points generated together as one chunk
+TERRAIN_CHUNK_WIDTH = TERRAIN_CHUNK_POINTS * TERRAIN_SPACING
+TERRAIN_CACHE_CHUNKS = 32  # Chunks kept in memory before the least recently used is dropped
+CRATER_RADIUS = 16         # Radius of the crater an arrow carves where it hits the ground
+CRATER_FLOOR = SCREEN_HEIGHT - 20  # Craters never dig below this height
+PLAYER_GROUND_OFFSET = 50  # Height of a player's position above the ground beneath them
+
+# AI Constants
+AI_DIFFICULTIES = {          # Standard deviation of aiming error in (radians, power)
+    "easy": (0.06, 1.2),
+    "medium": (0.025, 0.5),
+    "hard": (0.008, 0.15),
+}
+AI_ANGLES = 361             # Launch angles solved per shot
+AI_MAX_FLIGHT_FRAMES = 150   # Longest flight considered
+AI_GROUND_MARGIN = 3        # Pixels of clearance the AI keeps above the ground
+AI_FALLBACK_CANDIDATES = 8  # Out-of-range angles checked against hill tops at a time
+AI_THINK_FRAMES = 45         # Steps the AI waits before shooting in the windowed game
+
+# Rendering Constants
+TEXT_CACHE_SIZE = 128  # Rendered text surfaces kept for the HUD
+PREVIEW_FRAMES = 120                     # Longest flight the aiming preview shows
+PREVIEW_ANGLE_STEP = math.radians(0.5)   # Aim changes smaller than this reuse the cached arc
+PREVIEW_POWER_STEP = 0.5                 # Power changes smaller than this reuse the cached arc
+PREVIEW_CACHE_SIZE = 64                  # Preview arcs kept for reuse
+CHUNK_SURFACE_CACHE = 6    # Rendered terrain chunks kept for composing the background
+CAMERA_MARGIN = 250        # Closest an arrow gets to the screen edge before the view scrolls
+CAMERA_SMOOTHING = 0.15    # Fraction of the distance to its target the camera moves per step
+CAMERA_HOLD_FRAMES = 45    # Steps the camera lingers where the last arrow landed
+HEALTH_TAG_WIDTH = 60      # Width of the health tags shown over players in matches of more than two
+
+# Profiler Constants
+PROFILE_PHASES = ("events", "sim_actions", "sim_charging", "sim_arrows", "sim_particles",
+                  "draw_background", "draw_players", "draw_arrows", "draw_particles", "draw_ui",
+                  "draw_dirty", "draw_overlay", "present", "wait")
+PROFILE_COUNTS = ("arrows", "particles", "trail_points")
+PROFILE_HISTORY = 60           # Frames averaged by the overlay
+PROFILE_OVERLAY_INTERVAL = 15  # Frames between overlay refreshes
+PROFILE_OVERLAY_SIZE = (240, 300)
+
+# Particle Constants
+MAX_PARTICLES = 2000   # Capacity of the blood particle pool
+PARTICLE_LIFE = 60     # Frames a particle lives
+PARTICLE_GRAVITY = 0.1
+
+# Arrow Constants
+ARROW_START_OFFSET = 30    # Distance from the archer at which arrows are launched
+ARROW_START_HEIGHT = 20    # Height above the archer's feet at which arrows are launched
+WIND_FACTOR = 0.1          # Horizontal acceleration per unit of wind force
+ARROW_HALF_SIZE = 3        # Half the side of the square arrow hitbox
+TRAIL_LENGTH = 15          # Positions kept for the arrow trail
+ARROW_ROTATIONS = 360      # Pre-rendered arrow sprites, one per degree
+ARROW_SPRITE_RADIUS = 24   # Arrow sprites span this far from the arrow's centre
+TERRAIN_SAMPLE_STEP = 4.0  # Max pixels between terrain checks along an arrow's step
+SPATIAL_CELL = 64          # Side of the grid cells hitboxes are sorted into for collision checks
+SPATIAL_MIN_BOXES = 17     # Fewer hitboxes (8 players or less) are tested against every arrow without a grid
+SMALL_ARROW_BATCH = 8      # Batches up to this size are stepped arrow by arrow instead of with NumPy
+BOX_GROWTH = np.array([-1, -1, 1, 1])  # Signs that grow a (left, top, right, bottom) box outwards
+ARROW_TYPES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "arrow_types.json")
+MAX_ARROW_TYPES = 9        # Arrow types selectable with the number keys
+
+# Input actions understood by World.step
+CHARGE = "charge"    # Start charging at pos
+RELEASE = "release"  # Shoot towards pos with the charged power
+SHOOT = "shoot"      # Shoot directly with angle (radians) and power
+SKIP = "skip"        # Skip the current turn
+
+Action = namedtuple("Action", ["kind", "pos", "angle", "power", "arrow"], defaults=(None, 0.0, 0.0, 0))  # arrow indexes the arrow types
+
+# Match history kept by the world for statistics
+Shot = namedtuple("Shot", ["frame", "shooter", "angle", "power", "wind", "arrow"], defaults=(0,))
+Hit = namedtuple("Hit", ["frame", "shooter", "headshot", "x", "y"])
+Landing = namedtuple("Landing", ["frame", "shot", "zone", "target", "damage"])  # How each shot's flight ended
+
+# Where an arrow's flight ended
+ZONE_GROUND = "ground"  # Landed on the terrain
+ZONE_BODY = "body"      # Struck a player's body hitbox
+ZONE_HEAD = "head"      # Struck a player's head hitbox
+ZONE_LOST = "lost"      # Fell below the world
+ZONE_BLAST = "blast"    # Caught in an explosive arrow's blast
+
+# Replay file format
+REPLAY_MAGIC = b"SARP"
+REPLAY_VERSION = 6
+REPLAY_ACTION_CODES = {CHARGE: 1, RELEASE: 2, SHOOT: 3, SKIP: 4}
+REPLAY_ACTION_KINDS = {code: kind for kind, code in REPLAY_ACTION_CODES.items()}
+
+class TerrainChunk:
+    """One TERRAIN_CHUNK_WIDTH wide piece of terrain and its heightmap"""
+    
+    __slots__ = ("index", "left", "heights", "height_list", "modified")
+    
+    def __init__(self, index, point_heights):
+        self.index = index
+        self.left = index * TERRAIN_CHUNK_WIDTH
+        self.modified = False  # Carved chunks can't be regenerated, so they are never evicted
+        
+        # One entry per pixel column from left to the next chunk's left inclusive,
+        # joining the generated points (the last of which is the next chunk's first)
+        point_xs = np.arange(len(point_heights)) * TERRAIN_SPACING
+        self.heights = np.interp(np.arange(TERRAIN_CHUNK_WIDTH + 1), point_xs, point_heights)
+        self.height_list = self.heights.tolist()  # Same heightmap as a list for fast scalar lookups
 
 class Terrain:
-    """Handles the game terrain with hills and mountains"""
+    """Handles the game terrain with hills and mountains
     
-    def __init__(self):
-        self.points = []
-        self.generate_terrain()
+    The terrain stretches without limit in both directions. It is generated
+    lazily in chunks, each from its own seed, so any chunk can be dropped
+    from the bounded LRU cache and rebuilt identically when it is needed
+    again. Map size therefore costs neither memory nor startup time.
+    
+    The shape is a per-pixel heightmap that impacts carve craters into.
+    Carved chunks stay in memory, and every change is logged by revision
+    so renderers can repaint just the columns that changed.
+    """
     
-    def generate_terrain(self):
-        """Generate random hilly terrain"""
-        # Create terrain points across the screen
-        for x in range(0, SCREEN_WIDTH + 50, 50):
+    def __init__(self, seed=None, max_chunks=TERRAIN_CACHE_CHUNKS):
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.max_chunks = max_chunks
+        self.chunks = OrderedDict()
+        self.revision = 0  # Bumped whenever the shape changes
+        self.window = None  # (first chunk, last chunk, revision, heights) of the last vectorized lookup
+        self.last_chunk = None  # Chunk of the last scalar lookup, which the next one usually shares
+        self.changes = []  # (revision, left, right) of every carved column range
+        self.craters = []  # (x, y, radius) of every crater in order, enough to rebuild the shape from the seed
+    
+    def generate_points(self, index):
+        """Generate random hilly point heights for one chunk"""
+        rng = random.Random(f"{self.seed}:{index}")
+        heights = []
+        for _ in range(TERRAIN_CHUNK_POINTS):
             # Create hills with some randomness
             base_height = SCREEN_HEIGHT - 150
-            hill_height = random.randint(-100, 100)
+            hill_height = rng.randint(-100, 100)
             y = base_height + hill_height
             
             # Keep terrain within reasonable bounds
             y = max(SCREEN_HEIGHT - 300, min(SCREEN_HEIGHT - 50, y))
-            self.points.append((x, y))
+            heights.append(y)
+        return heights
+    
+    def get_chunk(self, index):
+        """Get a chunk, generating it on a miss and evicting the least recently used"""
+        chunk = self.chunks.get(index)
+        if chunk is not None:
+            self.chunks.move_to_end(index)
+            return chunk
+        
+        # The last point joins this chunk to the next one
+        point_heights = self.generate_points(index) + self.generate_points(index + 1)[:1]
+        chunk = self.chunks[index] = TerrainChunk(index, point_heights)
+        if len(self.chunks) > self.max_chunks:
+            # Evict the least recently used chunk that can be regenerated, other
+            # than this one; if every other chunk was carved the cache grows instead
+            for old_index, old_chunk in self.chunks.items():
+                if old_index != index and not old_chunk.modified:
+                    del self.chunks[old_index]
+                    if old_chunk is self.last_chunk:
+                        self.last_chunk = None  # A carve would regenerate it as a new chunk
+                    break
+        return chunk
+    
+    def carve(self, x, y, radius=CRATER_RADIUS):
+        """Carve a round crater centred on (x, y) into the heightmap"""
+        left = math.ceil(x - radius)
+        right = math.floor(x + radius)
+        columns = np.arange(left, right + 1)
+        crater = y + np.sqrt(np.maximum(radius ** 2 - (columns - x) ** 2, 0))
+        crater = np.minimum(crater, CRATER_FLOOR)
+        
+        # Chunks share their edge column, so the chunk before left may hold it too
+        for index in range(math.floor((left - 1) / TERRAIN_CHUNK_WIDTH), math.floor(right / TERRAIN_CHUNK_WIDTH) + 1):
+            chunk = self.get_chunk(index)
+            local = columns - chunk.left
+            inside = (local >= 0) & (local <= TERRAIN_CHUNK_WIDTH)
+            if not inside.any():
+                continue
+            local = local[inside]
+            heights = chunk.heights
+            heights[local] = np.maximum(heights[local], crater[inside])
+            start = int(local[0])
+            end = int(local[-1]) + 1
+            chunk.height_list[start:end] = heights[start:end].tolist()
+            chunk.modified = True
+        
+        self.craters.append((x, y, radius))
+        
+        # Outlines depend on the neighbouring columns too
+        self.revision += 1
+        self.changes.append((self.revision, left - 1, right + 2))
+    
+    def get_changes_since(self, revision):
+        """Get the (left, right) column ranges changed after revision"""
+        return [(left, right) for change, left, right in self.changes if change > revision]
+    
+    def get_ridges(self, left, right):
+        """Get x and height of every column around left to right where the ground bends down on both sides
+        
+        The heightmap is straight between columns, so these are the only
+        places besides its ends where a straight path can first touch it.
+        """
+        first = math.floor(left / TERRAIN_CHUNK_WIDTH)
+        last = math.floor(right / TERRAIN_CHUNK_WIDTH)
+        heights = self.get_window(first, last)
+        # Screen y grows downwards, so a ridge column is above the line between its neighbours
+        ridges = np.flatnonzero(2 * heights[1:-1] < heights[:-2] + heights[2:] - 1e-9) + 1
+        return ridges + float(first * TERRAIN_CHUNK_WIDTH), heights[ridges]
+    
+    def get_window(self, first, last):
+        """Get the height table of chunks first to last joined into one array"""
+        window = self.window
+        if window is not None and window[:3] == (first, last, self.revision):
+            return window[3]
+        
+        chunks = [self.get_chunk(index).heights for index in range(first, last + 1)]
+        heights = np.concatenate([chunk[:-1] for chunk in chunks] + [chunks[-1][-1:]])
+        self.window = (first, last, self.revision, heights)
+        return heights
+    
+    def get_heights_at(self, xs):
+        """Get terrain heights for an array of x coordinates"""
+        xs = np.asarray(xs, dtype=float)
+        if not xs.size:
+            return np.zeros(xs.shape)
+        first = math.floor(xs.min() / TERRAIN_CHUNK_WIDTH)
+        last = math.floor(xs.max() / TERRAIN_CHUNK_WIDTH)
+        heights = self.get_window(first, last)
+        
+        # Blend the two neighbouring pixel columns of the joined height table
+        local = xs - first * TERRAIN_CHUNK_WIDTH
+        i = np.minimum(local.astype(np.intp), len(heights) - 2)
+        return heights[i] + (local - i) * (heights[i + 1] - heights[i])
     
     def get_height_at_x(self, x):
         """Get terrain height at specific x coordinate"""
-        if x < 0:
-            return self.points[0][1]
-        if x >= SCREEN_WIDTH:
-            return self.points[-1][1]
-        
-        # Find the two points to interpolate between
-        for i in range(len(self.points) - 1):
-            x1, y1 = self.points[i]
-            x2, y2 = self.points[i + 1]
-            
-            if x1 <= x <= x2:
-                # Linear interpolation
-                ratio = (x - x1) / (x2 - x1)
-                return y1 + ratio * (y2 - y1)
-        
-        return SCREEN_HEIGHT - 100
-    
-    def draw(self, screen):
-        """Draw the terrain"""
-        if len(self.points) > 1:
-            # Draw terrain as filled polygon
-            terrain_points = self.points + [(SCREEN_WIDTH, SCREEN_HEIGHT), (0, SCREEN_HEIGHT)]
-            pygame.draw.polygon(screen, DARK_GREEN, terrain_points)
-            
-            # Draw terrain outline
-            pygame.draw.lines(screen, BLACK, False, self.points, 3)
+        chunk = self.last_chunk
+        if chunk is None or not 0 <= x - chunk.left < TERRAIN_CHUNK_WIDTH:
+            chunk = self.last_chunk = self.get_chunk(math.floor(x / TERRAIN_CHUNK_WIDTH))
+        heights = chunk.height_list
+        
+        # Blend the two neighbouring pixel columns of the chunk's height table
+        local = x - chunk.left
+        i = int(local)
+        height = heights[i]
+        fraction = local - i
+        if fraction:
+            height += fraction * (heights[i + 1] - height)
+        return height
+    
+    def draw(self, screen, offset_x=0, columns=None):
+        """Rasterize the sky and terrain into screen, whose left edge is offset_x pixels into the world
+        
+        Only the screen columns in the (left, right) range columns are
+        painted, so a crater can be patched into an existing surface.
+        """
+        left, right = columns if columns is not None else (0, screen.get_width())
+        left = max(left, 0)
+        right = min(right, screen.get_width())
+        if left >= right:
+            return
+        
+        # One extra column on each side for the outline
+        heights = self.get_heights_at(np.arange(left - 1, right + 1, dtype=float) + offset_x)
+        grounds = np.ceil(heights[1:-1]).astype(int).tolist()
+        
+        # The outline spans halfway to each neighbour so steep slopes stay joined
+        before = (heights[:-2] + heights[1:-1]) / 2
+        after = (heights[1:-1] + heights[2:]) / 2
+        line_tops = np.ceil(np.minimum(np.minimum(before, after), heights[1:-1]) - 1.5).astype(int).tolist()
+        line_bottoms = np.floor(np.maximum(np.maximum(before, after), heights[1:-1]) + 1.5).astype(int).tolist()
+        
+        # Sky, then one ground and one outline strip per column
+        height = screen.get_height()
+        fill = screen.fill
+        fill(WHITE, (left, 0, right - left, height))
+        for x, ground, line_top, line_bottom in zip(range(left, right), grounds, line_tops, line_bottoms):
+            fill(DARK_GREEN, (x, ground, 1, height - ground))
+            fill(BLACK, (x, line_top, 1, line_bottom - line_top + 1))
 
 class Player:
-    """Represents a stickman archer player"""
+    """Represents a stickman archer player
+    
+    Hitboxes are cached and only rebuilt when the player has moved, so
+    collision checks don't allocate new rectangles every step.
+    """
+    
+    __slots__ = ("x", "y", "health", "facing_right", "head_radius", "body_height", "arm_length", "leg_length",
+                 "hitbox_position", "head_rect", "body_rect", "hitboxes")
+    
+    sprites = {}  # Pre-rendered stickmen and their anchor points, by facing and proportions
     
     def __init__(self, x, y, facing_right=True):
         self.x = x
@@ -90,42 +340,85 @@ class Player:
         self.body_height = 40
         self.arm_length = 25
         self.leg_length = 30
+        self.hitbox_position = None  # Position the cached hitboxes were built for
     
-    def draw(self, screen):
-        """Draw the stickman player"""
+    def draw(self, screen, offset_x=0):
+        """Draw the stickman player with one blit of its pre-rendered sprite"""
+        sprite, (anchor_x, anchor_y) = self.get_sprite()
+        screen.blit(sprite, (int(self.x) - offset_x - anchor_x, int(self.y) - anchor_y))
+    
+    def get_sprite(self):
+        """Get the stickman sprite and the point in it that sits at the player's feet"""
+        key = (self.facing_right, self.head_radius, self.body_height, self.arm_length, self.leg_length)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            rect = self.get_draw_rect()
+            anchor = (int(self.x) - rect.left, int(self.y) - rect.top)
+            surface = pygame.Surface(rect.size)
+            surface.fill(WHITE)
+            surface.set_colorkey(WHITE)
+            self.draw_figure(surface, *anchor)
+            sprite = self.sprites[key] = (surface, anchor)
+        return sprite
+    
+    def draw_figure(self, screen, x, y):
+        """Draw the stickman's lines with its feet at the whole pixel (x, y)"""
         # Head
-        pygame.draw.circle(screen, BLACK, (int(self.x), int(self.y - self.body_height - self.head_radius)), self.head_radius, 3)
+        pygame.draw.circle(screen, BLACK, (x, y - self.body_height - self.head_radius), self.head_radius, 3)
         
         # Body
-        body_start = (int(self.x), int(self.y - self.body_height))
-        body_end = (int(self.x), int(self.y))
-        pygame.draw.line(screen, BLACK, body_start, body_end, 3)
+        pygame.draw.line(screen, BLACK, (x, y - self.body_height), (x, y), 3)
         
         # Arms
-        arm_y = int(self.y - self.body_height * 0.7)
+        arm_y = y - int(self.body_height * 0.7)
         if self.facing_right:
-            arm_end = (int(self.x + self.arm_length), arm_y - 10)
+            arm_end = (x + self.arm_length, arm_y - 10)
         else:
-            arm_end = (int(self.x - self.arm_length), arm_y - 10)
-        pygame.draw.line(screen, BLACK, (int(self.x), arm_y), arm_end, 3)
+            arm_end = (x - self.arm_length, arm_y - 10)
+        pygame.draw.line(screen, BLACK, (x, arm_y), arm_end, 3)
         
         # Legs
-        leg_left = (int(self.x - 15), int(self.y + self.leg_length))
-        leg_right = (int(self.x + 15), int(self.y + self.leg_length))
-        pygame.draw.line(screen, BLACK, (int(self.x), int(self.y)), leg_left, 3)
-        pygame.draw.line(screen, BLACK, (int(self.x), int(self.y)), leg_right, 3)
+        pygame.draw.line(screen, BLACK, (x, y), (x - 15, y + self.leg_length), 3)
+        pygame.draw.line(screen, BLACK, (x, y), (x + 15, y + self.leg_length), 3)
     
-    def get_head_rect(self):
-        """Get rectangle for head hitbox"""
+    def update_hitboxes(self):
+        """Rebuild the cached hitboxes if the player moved since they were built"""
+        if self.hitbox_position == (self.x, self.y):
+            return
+        self.hitbox_position = (self.x, self.y)
+        
         head_x = self.x - self.head_radius
         head_y = self.y - self.body_height - self.head_radius * 2
-        return pygame.Rect(head_x, head_y, self.head_radius * 2, self.head_radius * 2)
-    
-    def get_body_rect(self):
-        """Get rectangle for body hitbox"""
+        self.head_rect = pygame.Rect(head_x, head_y, self.head_radius * 2, self.head_radius * 2)
+        
         body_x = self.x - 10
         body_y = self.y - self.body_height
-        return pygame.Rect(body_x, body_y, 20, self.body_height)
+        self.body_rect = pygame.Rect(body_x, body_y, 20, self.body_height)
+        
+        # Head then body as (left, top, right, bottom) for the swept collision test
+        self.hitboxes = tuple((rect.left, rect.top, rect.right, rect.bottom) for rect in (self.head_rect, self.body_rect))
+    
+    def get_head_rect(self):
+        """Get rectangle for head hitbox (shared, do not modify)"""
+        self.update_hitboxes()
+        return self.head_rect
+    
+    def get_body_rect(self):
+        """Get rectangle for body hitbox (shared, do not modify)"""
+        self.update_hitboxes()
+        return self.body_rect
+    
+    def get_hitboxes(self):
+        """Get the head and body hitboxes as (left, top, right, bottom) tuples"""
+        self.update_hitboxes()
+        return self.hitboxes
+    
+    def get_draw_rect(self):
+        """Get rectangle covering everything draw() paints"""
+        top = self.y - self.body_height - self.head_radius * 2 - 2
+        bottom = self.y + self.leg_length + 2
+        return pygame.Rect(int(self.x) - self.arm_length - 2, int(top),
+                           (self.arm_length + 2) * 2, int(bottom - top) + 1)
     
     def take_damage(self, damage):
         """Apply damage to player"""
@@ -137,114 +430,695 @@ class Player:
         """Check if player is still alive"""
         return self.health > 0
 
-class BloodParticle:
-    """Blood particle for hit effects"""
+class ParticleSystem:
+    """Pool of blood particles stored as NumPy arrays and updated in batches"""
     
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
+    def __init__(self, capacity=MAX_PARTICLES, seed=None):
+        self.capacity = capacity
+        self.count = 0  # Live particles occupy indices [0, count)
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.velocity_x = np.zeros(capacity)
+        self.velocity_y = np.zeros(capacity)
+        self.life = np.zeros(capacity, dtype=np.int32)
+        self.size = np.zeros(capacity, dtype=np.int32)
+        self.arrays = (self.x, self.y, self.velocity_x, self.velocity_y, self.life, self.size)
+        self.rng = np.random.default_rng(seed)
+    
+    def __len__(self):
+        return self.count
+    
+    def emit(self, x, y, count):
+        """Spawn up to count particles at (x, y), dropping any beyond capacity"""
+        count = min(count, self.capacity - self.count)
+        if count <= 0:
+            return
+        
+        new = slice(self.count, self.count + count)
+        self.x[new] = x
+        self.y[new] = y
         # Random velocity for particle spread
-        self.velocity_x = random.uniform(-3, 3)
-        self.velocity_y = random.uniform(-4, -1)
-        self.life = 60  # Frames to live
-        self.max_life = 60
-        self.size = random.randint(2, 5)
+        self.velocity_x[new] = self.rng.uniform(-3, 3, count)
+        self.velocity_y[new] = self.rng.uniform(-4, -1, count)
+        self.life[new] = PARTICLE_LIFE
+        self.size[new] = self.rng.integers(2, 6, count)
+        self.count += count
     
     def update(self):
-        """Update particle position and life"""
-        self.x += self.velocity_x
-        self.y += self.velocity_y
-        self.velocity_y += 0.1  # Gravity on particles
-        self.life -= 1
-    
-    def draw(self, screen):
-        """Draw blood particle"""
-        if self.life <= 0:
+        """Update positions and life of every particle, then drop dead ones"""
+        n = self.count
+        if n == 0:
             return
         
-        # Fade out over time
-        alpha = self.life / self.max_life
-        red_intensity = int(255 * alpha)
-        color = (red_intensity, 0, 0)
+        self.x[:n] += self.velocity_x[:n]
+        self.y[:n] += self.velocity_y[:n]
+        self.velocity_y[:n] += PARTICLE_GRAVITY
+        self.life[:n] -= 1
+        self.compact()
+    
+    def compact(self):
+        """Swap live particles from the tail into dead slots at the front"""
+        n = self.count
+        alive = self.life[:n] > 0
+        live = int(np.count_nonzero(alive))
+        if live == n:
+            return
         
-        pygame.draw.circle(screen, color, (int(self.x), int(self.y)), 
-                         max(1, int(self.size * alpha)))
+        holes = np.flatnonzero(~alive[:live])
+        movers = np.flatnonzero(alive[live:]) + live
+        for array in self.arrays:
+            array[holes] = array[movers]
+        self.count = live
     
-    def is_alive(self):
-        """Check if particle is still alive"""
-        return self.life > 0
-
-class Arrow:
-    """Represents an arrow projectile"""
+    def get_draw_rect(self):
+        """Get rectangle covering every live particle, or None if there are none"""
+        n = self.count
+        if n == 0:
+            return None
+        
+        # Cover the previous positions too since drawing may be interpolated
+        xs = np.concatenate((self.x[:n], self.x[:n] - self.velocity_x[:n]))
+        ys = np.concatenate((self.y[:n], self.y[:n] - self.velocity_y[:n] + PARTICLE_GRAVITY))
+        left = int(xs.min()) - 6
+        top = int(ys.min()) - 6
+        right = int(xs.max()) + 6
+        bottom = int(ys.max()) + 6
+        return pygame.Rect(left, top, right - left, bottom - top)
     
-    def __init__(self, x, y, velocity_x, velocity_y, shooter_id):
-        self.x = x
-        self.y = y
-        self.velocity_x = velocity_x
-        self.velocity_y = velocity_y
-        self.active = True
-        self.trail = []  # For visual trail effect
-        self.shooter_id = shooter_id  # Track who shot this arrow
-        self.initial_speed = math.sqrt(velocity_x**2 + velocity_y**2)  # Store initial speed
-    
-    def update(self, wind_force):
-        """Update arrow position with physics"""
-        if not self.active:
+    def clear(self):
+        """Remove all particles"""
+        self.count = 0
+    
+    def draw(self, screen, interpolation=1.0, offset_x=0):
+        """Draw all live particles, fading them out over their life"""
+        n = self.count
+        if n == 0:
             return
         
-        # Store position for trail
-        self.trail.append((self.x, self.y))
-        if len(self.trail) > 15:  # Longer trail for better visibility
-            self.trail.pop(0)
+        # Step back from the latest positions towards the previous ones
+        lag = 1.0 - interpolation
+        xs = (self.x[:n] - self.velocity_x[:n] * lag - offset_x).astype(np.int32).tolist()
+        ys = (self.y[:n] - (self.velocity_y[:n] - PARTICLE_GRAVITY) * lag).astype(np.int32).tolist()
         
-        # Apply gravity
-        self.velocity_y += GRAVITY
+        alpha = self.life[:n] / PARTICLE_LIFE
+        reds = (255 * alpha).astype(np.int32).tolist()
+        radii = np.maximum(1, (self.size[:n] * alpha).astype(np.int32)).tolist()
         
-        # Apply wind force
-        self.velocity_x += wind_force * 0.1
-        
-        # Update position
-        self.x += self.velocity_x
-        self.y += self.velocity_y
-        
-        # Check if arrow is off screen or hit ground
-        if (self.x < 0 or self.x > SCREEN_WIDTH or 
-            self.y > SCREEN_HEIGHT):
-            self.active = False
+        for x, y, red, radius in zip(xs, ys, reds, radii):
+            pygame.draw.circle(screen, (red, 0, 0), (x, y), radius)
+
+def sweep_boxes(start_x, start_y, end_x, end_y, boxes):
+    """Get the fraction along each segment where it first enters its box
+    
+    Segments are given as arrays of n start and end points and boxes as an
+    (n, 4) array of left, top, right, bottom, one box per segment. Returns
+    an array of n fractions that is inf wherever a segment misses its box.
+    """
+    start = np.stack((start_x, start_y), axis=1)
+    delta = np.stack((end_x, end_y), axis=1) - start
+    # A tiny delta stands in for zero so parallel segments need no special case
+    delta[delta == 0] = 1e-12
+    
+    # Slab test on both axes at once: enter when inside both, exit at the first way out
+    t1 = (boxes[:, :2] - start) / delta
+    t2 = (boxes[:, 2:] - start) / delta
+    t_enter = np.maximum(np.minimum(t1, t2).max(axis=1), 0)
+    t_exit = np.minimum(np.maximum(t1, t2).min(axis=1), 1)
+    return np.where(t_enter <= t_exit, t_enter, np.inf)
+
+class SpatialHash:
+    """Uniform grid listing which boxes overlap each cell, for finding the boxes near a segment
+    
+    The grid only spans the area the boxes cover, so it stays small however
+    far arrows fly. Cells are stored flat as one array of box indices
+    grouped by cell plus each cell's start in it, so a query for any
+    number of segments is a handful of array operations and each segment
+    only meets the boxes in the few cells its bounds touch.
+    """
+    
+    def __init__(self, boxes, cell_size=SPATIAL_CELL):
+        self.boxes = boxes
+        self.cell_size = cell_size
+        ranges = np.floor(boxes / cell_size).astype(np.int64)  # First and last cell of each box
+        self.origin = np.tile(ranges[:, :2].min(axis=0), 2)
+        ranges -= self.origin
+        self.columns, self.rows = ranges[:, 2:].max(axis=0) + 1
+        
+        box_ids, cells = self.expand(ranges)
+        order = np.argsort(cells, kind="stable")
+        self.cell_boxes = box_ids[order]
+        self.cell_starts = np.searchsorted(cells[order], np.arange(self.columns * self.rows + 1))
+    
+    def expand(self, ranges):
+        """List every cell in each (left, top, right, bottom) cell range as (range index, cell) pairs"""
+        widths = ranges[:, 2] - ranges[:, 0] + 1
+        heights = ranges[:, 3] - ranges[:, 1] + 1
+        counts = np.where((widths > 0) & (heights > 0), widths * heights, 0)
+        owners = np.repeat(np.arange(len(ranges)), counts)
+        
+        # Each pair's position within its range, unravelled into column and row
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        widths = widths[owners]
+        columns = ranges[owners, 0] + offsets % widths
+        rows = ranges[owners, 1] + offsets // widths
+        return owners, rows * self.columns + columns
+    
+    def query(self, left, top, right, bottom):
+        """Get (query index, box index) pairs for the boxes in the cells each query rectangle touches
+        
+        Pairs are sorted by query then box and never repeat, even when a
+        box and a rectangle share several cells.
+        """
+        ranges = np.floor(np.column_stack((left, top, right, bottom)) / self.cell_size).astype(np.int64) - self.origin
+        # Cells outside the grid hold no boxes
+        np.maximum(ranges[:, :2], 0, out=ranges[:, :2])
+        np.minimum(ranges[:, 2], self.columns - 1, out=ranges[:, 2])
+        np.minimum(ranges[:, 3], self.rows - 1, out=ranges[:, 3])
+        queries, cells = self.expand(ranges)
+        
+        starts = self.cell_starts[cells]
+        counts = self.cell_starts[cells + 1] - starts
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        queries = np.repeat(queries, counts)
+        boxes = self.cell_boxes[np.repeat(starts, counts) + offsets]
+        pairs = np.unique(queries * len(self.boxes) + boxes)
+        return pairs // len(self.boxes), pairs % len(self.boxes)
+
+# How one type of arrow differs from a standard one. speed, gravity, wind and
+# damage scale MAX_POWER's launch speed, GRAVITY, WIND_FACTOR and the hit
+# damages. Split arrows burst into split arrows of type split_into (the first
+# type if None), spread radians apart, once they start to fall. Explosive
+# arrows deal blast_damage to everyone within blast_radius of where they land.
+ArrowType = namedtuple("ArrowType", ["name", "speed", "gravity", "wind", "half_size", "damage", "crater",
+                                     "split", "spread", "split_into", "blast_radius", "blast_damage"],
+                       defaults=(1.0, 1.0, 1.0, ARROW_HALF_SIZE, 1.0, CRATER_RADIUS, 0, 0.0, None, 0, 0))
+
+class ArrowTypes:
+    """Registry of the arrow types players can shoot, loaded from a JSON config file
+    
+    The file maps each type's name to the ArrowType fields in which it
+    differs from a standard arrow. Types keep the file's order, and the
+    first one is shot whenever no other is chosen.
+    """
+    
+    loaded = {}  # Registries by config path, so every world shares one
+    
+    def __init__(self, types):
+        if not 1 <= len(types) <= MAX_ARROW_TYPES:
+            raise ValueError(f"Between 1 and {MAX_ARROW_TYPES} arrow types are needed")
+        self.types = list(types)
+        self.indices = {arrow_type.name: index for index, arrow_type in enumerate(self.types)}
+        for arrow_type in self.types:
+            if not arrow_type.split:
+                continue
+            if arrow_type.split_into is not None and arrow_type.split_into not in self.indices:
+                raise ValueError(f"Arrow type {arrow_type.name} splits into unknown type {arrow_type.split_into}")
+            child = self.types[self.indices.get(arrow_type.split_into, 0)]
+            if child.split:
+                raise ValueError(f"Arrow type {arrow_type.name} splits into {child.name}, which splits again")
+    
+    def __len__(self):
+        return len(self.types)
+    
+    def __iter__(self):
+        return iter(self.types)
+    
+    def __getitem__(self, index):
+        return self.types[index]
+    
+    def get_names(self):
+        """Get the type names in registry order"""
+        return [arrow_type.name for arrow_type in self.types]
+    
+    def index(self, name):
+        """Get the index of the type called name"""
+        if name not in self.indices:
+            raise ValueError(f"Unknown arrow type {name}, expected one of {', '.join(self.indices)}")
+        return self.indices[name]
+    
+    @classmethod
+    def load(cls, path=ARROW_TYPES_PATH):
+        """Get the registry in a config file, reading the file only the first time"""
+        registry = cls.loaded.get(path)
+        if registry is None:
+            with open(path) as config_file:
+                config = json.load(config_file)
+            types = []
+            for name, fields in config.items():
+                unknown = set(fields) - set(ArrowType._fields[1:])
+                if unknown:
+                    raise ValueError(f"Arrow type {name} has unknown fields: {', '.join(sorted(unknown))}")
+                types.append(ArrowType(name, **fields))
+            registry = cls.loaded[path] = cls(types)
+        return registry
+    
+    def compile(self):
+        """Get the types' properties as an ArrowTable for the current constants"""
+        return ArrowTable(self)
+
+class ArrowTable:
+    """Arrow type properties with the global constants applied, indexed by type
+    
+    Tables are compiled when a World is created, so constants overridden
+    before then, as simulate.py --set does, still apply. Arrows copy their
+    type's accelerations and hitbox size when they are spawned, so a step
+    costs the same however many types there are. Properties that batches
+    gather are NumPy arrays, those looked up once per impact are lists.
+    """
+    
+    def __init__(self, types):
+        self.names = types.get_names()
+        self.speed = [arrow_type.speed for arrow_type in types]
+        self.gravity = [GRAVITY * arrow_type.gravity for arrow_type in types]
+        self.wind = [WIND_FACTOR * arrow_type.wind for arrow_type in types]
+        self.half_size = [arrow_type.half_size for arrow_type in types]
+        self.body_damage = [round(BODY_DAMAGE * arrow_type.damage) for arrow_type in types]
+        self.head_damage = [round(HEAD_DAMAGE * arrow_type.damage) for arrow_type in types]
+        self.crater = [arrow_type.crater for arrow_type in types]
+        self.spread = [arrow_type.spread for arrow_type in types]
+        self.split_into = [types.indices.get(arrow_type.split_into, 0) for arrow_type in types]
+        self.blast_damage = [arrow_type.blast_damage for arrow_type in types]
+        self.split = np.array([arrow_type.split for arrow_type in types], dtype=np.int32)
+        self.blast_radius = np.array([arrow_type.blast_radius for arrow_type in types], dtype=float)
+        self.special = [bool(arrow_type.split or arrow_type.blast_radius) for arrow_type in types]
     
-    def draw(self, screen):
-        """Draw the arrow and its trail with better visibility"""
-        if not self.active:
+    def __len__(self):
+        return len(self.names)
+
+def flight_path(start_x, start_y, velocity_x, velocity_y, wind_force, frames, gravity=None, wind_factor=None):
+    """Get an arrow's position after each number of steps in frames, in closed form
+    
+    Each step adds gravity and wind to the velocity before moving, so after
+    n steps the arrow has moved n velocities plus n(n+1)/2 accelerations.
+    gravity and wind_factor default to a standard arrow's. Arguments
+    broadcast, so many launches can be traced at once.
+    """
+    gravity = GRAVITY if gravity is None else gravity
+    wind_factor = WIND_FACTOR if wind_factor is None else wind_factor
+    ramp = frames * (frames + 1) / 2
+    return (start_x + velocity_x * frames + wind_force * wind_factor * ramp,
+            start_y + velocity_y * frames + gravity * ramp)
+
+class ArrowBatch:
+    """All arrows in flight, stored as NumPy arrays and advanced together
+    
+    Trails are ring buffers of the last TRAIL_LENGTH positions. All arrows
+    step together, so they share one write slot and recording a position
+    is a single array assignment however long the trails are.
+    
+    Each arrow's type is looked up in an ArrowTable once, when it is
+    spawned, and its accelerations and hitbox size are kept per arrow.
+    Arrows that split or explode are counted, so steps without any skip
+    those checks.
+    """
+    
+    trail_sprites = None  # Pre-rendered trail dots by trail length and age, built on first draw
+    arrow_sprites = [None] * ARROW_ROTATIONS  # Pre-rendered arrows by quantized angle, built on demand
+    
+    def __init__(self, capacity=16, table=None):
+        self.table = table if table is not None else ArrowTypes.load().compile()
+        self.count = 0  # Live arrows occupy indices [0, count)
+        self.special_count = 0  # Live arrows whose type splits or explodes
+        self.trail_head = 0  # Ring slot the next trail position is written to
+        self.next_id = 0  # Id given to the next arrow spawned
+        self.allocate(capacity)
+    
+    def allocate(self, capacity):
+        """Resize the arrays to hold capacity arrows, keeping live ones"""
+        old = getattr(self, "arrays", None)
+        self.capacity = capacity
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.velocity_x = np.zeros(capacity)
+        self.velocity_y = np.zeros(capacity)
+        self.shooter = np.zeros(capacity, dtype=np.int8)  # Track who shot each arrow
+        self.wind = np.zeros(capacity)  # Wind force each arrow was launched into
+        self.previous_x = np.zeros(capacity)  # Position before the last step, for interpolation
+        self.previous_y = np.zeros(capacity)
+        self.trail_x = np.zeros((capacity, TRAIL_LENGTH))  # Recent positions for the visual trail
+        self.trail_y = np.zeros((capacity, TRAIL_LENGTH))
+        self.trail_length = np.zeros(capacity, dtype=np.int16)  # Valid positions in each trail
+        self.ids = np.zeros(capacity, dtype=np.int32)  # Lets observers follow arrows across compaction
+        self.kind = np.zeros(capacity, dtype=np.int8)  # Index of each arrow's type in the table
+        self.shot = np.zeros(capacity, dtype=np.int32)  # Index of the shot each arrow came from, -1 for none
+        self.acceleration_x = np.zeros(capacity)  # Wind and gravity of each arrow's type, applied every step
+        self.acceleration_y = np.zeros(capacity)
+        self.half_size = np.zeros(capacity)  # Half the side of each arrow's square hitbox
+        self.special = np.zeros(capacity, dtype=bool)  # Whether each arrow's type splits or explodes
+        self.arrays = (self.x, self.y, self.velocity_x, self.velocity_y, self.shooter, self.wind,
+                       self.previous_x, self.previous_y, self.trail_x, self.trail_y, self.trail_length, self.ids,
+                       self.kind, self.shot, self.acceleration_x, self.acceleration_y, self.half_size, self.special)
+        
+        if old is not None:
+            for new_array, old_array in zip(self.arrays, old):
+                new_array[:self.count] = old_array[:self.count]
+    
+    def __len__(self):
+        return self.count
+    
+    def spawn(self, x, y, velocity_x, velocity_y, shooter_id, wind_force=0.0, kind=0, shot=-1):
+        """Add an arrow of type kind to the batch"""
+        if self.count == self.capacity:
+            self.allocate(self.capacity * 2)
+        
+        i = self.count
+        self.x[i] = x
+        self.y[i] = y
+        self.velocity_x[i] = velocity_x
+        self.velocity_y[i] = velocity_y
+        self.shooter[i] = shooter_id
+        self.wind[i] = wind_force
+        self.kind[i] = kind
+        self.shot[i] = shot
+        self.acceleration_x[i] = wind_force * self.table.wind[kind]
+        self.acceleration_y[i] = self.table.gravity[kind]
+        self.half_size[i] = self.table.half_size[kind]
+        self.special[i] = special = self.table.special[kind]
+        self.special_count += special
+        self.previous_x[i] = x
+        self.previous_y[i] = y
+        self.trail_length[i] = 0
+        self.ids[i] = self.next_id
+        self.next_id += 1
+        self.count += 1
+    
+    def advance(self):
+        """Move every arrow one frame, return the start points of the step"""
+        start_x, start_y = self.record_trails()
+        n = self.count
+        
+        # Apply gravity and wind, then move
+        self.velocity_y[:n] += self.acceleration_y[:n]
+        self.velocity_x[:n] += self.acceleration_x[:n]
+        self.x[:n] += self.velocity_x[:n]
+        self.y[:n] += self.velocity_y[:n]
+        return start_x, start_y
+    
+    def record_trails(self):
+        """Start a step from the current positions, storing them in the trails, and return them"""
+        n = self.count
+        self.previous_x[:n] = self.x[:n]
+        self.previous_y[:n] = self.y[:n]
+        start_x = self.previous_x[:n]
+        start_y = self.previous_y[:n]
+        
+        # Store position for trail, overwriting the oldest
+        self.trail_x[:n, self.trail_head] = start_x
+        self.trail_y[:n, self.trail_head] = start_y
+        np.minimum(self.trail_length[:n] + 1, TRAIL_LENGTH, out=self.trail_length[:n])
+        self.trail_head = (self.trail_head + 1) % TRAIL_LENGTH
+        return start_x, start_y
+    
+    def sweep_terrain(self, terrain, start_x, start_y):
+        """Get the fraction of the last step at which each arrow hit the ground"""
+        n = self.count
+        end_x = self.x[:n]
+        end_y = self.y[:n]
+        
+        # Sample every segment densely enough that no hill top is skipped
+        longest = np.hypot(end_x - start_x, end_y - start_y).max()
+        samples = max(1, int(math.ceil(longest / TERRAIN_SAMPLE_STEP)))
+        t = np.arange(samples + 1) / samples
+        xs = start_x[:, None] + (end_x - start_x)[:, None] * t
+        ys = start_y[:, None] + (end_y - start_y)[:, None] * t
+        depth = ys - terrain.get_heights_at(xs)
+        
+        below = depth >= 0
+        below[:, 0] = False  # Arrows start the step above the ground
+        hit = below.any(axis=1)
+        if not hit.any():
+            return np.full(n, np.inf)
+        
+        # Refine the crossing between the last sample above and first below
+        first = np.maximum(below.argmax(axis=1), 1)
+        rows = np.arange(n)
+        before = depth[rows, first - 1]
+        after = depth[rows, first]
+        gap = np.where(hit, after - before, 1)
+        crossing = t[first - 1] + (t[first] - t[first - 1]) * (-before / gap)
+        return np.where(hit, np.clip(crossing, 0, 1), np.inf)
+    
+    def sweep_boxes(self, start_x, start_y, boxes, grid=None):
+        """Get (arrow, box, fraction) for the boxes the arrows' last step may have touched
+        
+        With a SpatialHash of the boxes only those in the cells near each
+        step are tested, otherwise every arrow is tested against every box.
+        """
+        n = self.count
+        end_x = self.x[:n]
+        end_y = self.y[:n]
+        # Grow the boxes by each arrow's own half size instead of sweeping a square
+        margin = self.half_size[:n, None] * BOX_GROWTH
+        if grid is None:
+            rows = np.repeat(np.arange(n), len(boxes))
+            box_ids = np.tile(np.arange(len(boxes)), n)
+        else:
+            bounds = np.column_stack((np.minimum(start_x, end_x), np.minimum(start_y, end_y),
+                                      np.maximum(start_x, end_x), np.maximum(start_y, end_y))) + margin
+            rows, box_ids = grid.query(*bounds.T)
+        grown = boxes[box_ids] + margin[rows]
+        return rows, box_ids, sweep_boxes(start_x[rows], start_y[rows], end_x[rows], end_y[rows], grown)
+    
+    def step_few(self, terrain, boxes, owners):
+        """Advance a small batch and sweep it against the terrain and boxes one arrow at a time
+        
+        Gives the same results as advance, sweep_terrain and sweep_boxes,
+        without the fixed cost of their NumPy calls, which dominates when
+        only an arrow or two is in flight. boxes and owners are lists.
+        Returns lists of each arrow's start point, the fraction of the step
+        at which it hit the ground, and its first contact as a box and a
+        fraction, which is inf where it touched none.
+        """
+        n = self.count
+        head = self.trail_head
+        self.trail_head = (head + 1) % TRAIL_LENGTH
+        start_x = self.x[:n].tolist()
+        start_y = self.y[:n].tolist()
+        end_x = []
+        end_y = []
+        for i, (x, y, velocity_x, velocity_y, acceleration_x, acceleration_y, length) in enumerate(zip(
+                start_x, start_y, self.velocity_x[:n].tolist(), self.velocity_y[:n].tolist(),
+                self.acceleration_x[:n].tolist(), self.acceleration_y[:n].tolist(), self.trail_length[:n].tolist())):
+            self.previous_x[i] = self.trail_x[i, head] = x
+            self.previous_y[i] = self.trail_y[i, head] = y
+            self.trail_length[i] = min(length + 1, TRAIL_LENGTH)
+            velocity_y += acceleration_y
+            velocity_x += acceleration_x
+            self.velocity_x[i] = velocity_x
+            self.velocity_y[i] = velocity_y
+            self.x[i] = x = x + velocity_x
+            self.y[i] = y = y + velocity_y
+            end_x.append(x)
+            end_y.append(y)
+        
+        # The whole batch shares one sample count, as in sweep_terrain
+        longest = max(math.hypot(x1 - x0, y1 - y0) for x0, y0, x1, y1 in zip(start_x, start_y, end_x, end_y))
+        samples = max(1, int(math.ceil(longest / TERRAIN_SAMPLE_STEP)))
+        t = [sample / samples for sample in range(samples + 1)]
+        
+        hit_time = []
+        box = []
+        box_time = []
+        for x0, y0, x1, y1, half_size, shooter in zip(start_x, start_y, end_x, end_y, self.half_size[:n].tolist(),
+                                                      self.shooter[:n].tolist()):
+            dx = x1 - x0
+            dy = y1 - y0
+            
+            # Walk the samples to the first one in the ground, then refine the crossing
+            crossing = math.inf
+            before = y0 - terrain.get_height_at_x(x0)
+            for sample in range(1, samples + 1):
+                after = (y0 + dy * t[sample]) - terrain.get_height_at_x(x0 + dx * t[sample])
+                if after >= 0:
+                    gap = after - before
+                    fraction = -before / gap if gap else 0.0
+                    crossing = min(max(t[sample - 1] + (t[sample] - t[sample - 1]) * fraction, 0.0), 1.0)
+                    break
+                before = after
+            hit_time.append(crossing)
+            
+            # Slab test against each grown box, keeping the earliest and lowest contact
+            dx = dx or 1e-12
+            dy = dy or 1e-12
+            first_box = 0
+            first_time = math.inf
+            for index, ((left, top, right, bottom), owner) in enumerate(zip(boxes, owners)):
+                if owner == shooter:
+                    continue
+                t1_x = (left - half_size - x0) / dx
+                t2_x = (right + half_size - x0) / dx
+                t1_y = (top - half_size - y0) / dy
+                t2_y = (bottom + half_size - y0) / dy
+                t_enter = max(min(t1_x, t2_x), min(t1_y, t2_y), 0.0)
+                t_exit = min(max(t1_x, t2_x), max(t1_y, t2_y), 1.0)
+                if t_enter <= t_exit and t_enter < first_time:
+                    first_box = index
+                    first_time = t_enter
+            box.append(first_box)
+            box_time.append(first_time)
+        return start_x, start_y, hit_time, box, box_time
+    
+    def split(self, rows):
+        """Replace the arrows at rows with their type's split arrows, fanned out around their heading"""
+        table = self.table
+        for i in rows.tolist():
+            kind = int(self.kind[i])
+            count = int(table.split[kind])
+            offsets = (np.arange(count) - (count - 1) / 2) * table.spread[kind]
+            cos = np.cos(offsets)
+            sin = np.sin(offsets)
+            velocity_x = float(self.velocity_x[i])
+            velocity_y = float(self.velocity_y[i])
+            for child_cos, child_sin in zip(cos.tolist(), sin.tolist()):
+                # Spawning may reallocate the arrays, so the parent is read from them every time
+                self.spawn(float(self.x[i]), float(self.y[i]),
+                           velocity_x * child_cos - velocity_y * child_sin, velocity_x * child_sin + velocity_y * child_cos,
+                           int(self.shooter[i]), float(self.wind[i]), table.split_into[kind], int(self.shot[i]))
+        
+        keep = np.ones(self.count, dtype=bool)
+        keep[rows] = False
+        self.compact(keep)
+    
+    def compact(self, keep):
+        """Drop arrows where keep is False by swapping in arrows from the tail"""
+        n = self.count
+        live = int(np.count_nonzero(keep))
+        if live == n:
             return
         
-        # Draw trail with better colors
-        for i, pos in enumerate(self.trail):
-            alpha = (i + 1) / len(self.trail)
-            # More visible trail colors
-            color = (int(200 * alpha), int(100 * alpha), 0)
-            size = max(1, int(3 * alpha))
-            pygame.draw.circle(screen, color, (int(pos[0]), int(pos[1])), size)
-        
-        # Calculate arrow angle based on velocity
-        angle = math.atan2(self.velocity_y, self.velocity_x)
+        holes = np.flatnonzero(~keep[:live])
+        movers = np.flatnonzero(keep[live:]) + live
+        for array in self.arrays:
+            array[holes] = array[movers]
+        self.count = live
+        if self.special_count:
+            self.special_count = int(np.count_nonzero(self.special[:live]))
+    
+    def select(self, rows):
+        """Keep only the arrows at rows, in that order"""
+        for array in self.arrays:
+            array[:len(rows)] = array[rows]
+        self.count = len(rows)
+        self.special_count = int(np.count_nonzero(self.special[:self.count]))
+    
+    def get_trail_order(self):
+        """Get the ring slots from oldest to newest and which of them each arrow has filled"""
+        order = (self.trail_head + np.arange(TRAIL_LENGTH)) % TRAIL_LENGTH
+        # Trails fill from the newest end, so an arrow with k positions has the last k slots
+        filled = np.arange(TRAIL_LENGTH) >= TRAIL_LENGTH - self.trail_length[:self.count, None]
+        return order, filled
+    
+    def get_trail_point_count(self):
+        """Count the trail positions of every live arrow"""
+        return int(self.trail_length[:self.count].sum())
+    
+    def get_draw_rects(self):
+        """Get one rectangle per arrow covering the arrow and its trail"""
+        n = self.count
+        x = self.x[:n, None]
+        y = self.y[:n, None]
+        # Unfilled slots fall back to the arrow's own position
+        order, filled = self.get_trail_order()
+        trail_x = np.where(filled, self.trail_x[:n, order], x)
+        trail_y = np.where(filled, self.trail_y[:n, order], y)
+        # The arrowhead and fletching reach up to 20 px from the arrow centre
+        lefts = (np.minimum(trail_x.min(axis=1), x[:, 0]).astype(int) - 24).tolist()
+        tops = (np.minimum(trail_y.min(axis=1), y[:, 0]).astype(int) - 24).tolist()
+        rights = (np.maximum(trail_x.max(axis=1), x[:, 0]).astype(int) + 24).tolist()
+        bottoms = (np.maximum(trail_y.max(axis=1), y[:, 0]).astype(int) + 24).tolist()
+        return [pygame.Rect(left, top, right - left, bottom - top)
+                for left, top, right, bottom in zip(lefts, tops, rights, bottoms)]
+    
+    @classmethod
+    def get_trail_sprites(cls):
+        """Get trail dots indexed by [trail length][age], rendering them once"""
+        if cls.trail_sprites is None:
+            cls.trail_sprites = [[]]
+            for length in range(1, TRAIL_LENGTH + 1):
+                dots = []
+                for i in range(length):
+                    # Older positions are darker and smaller
+                    alpha = (i + 1) / length
+                    color = (int(200 * alpha), int(100 * alpha), 0)
+                    size = max(1, int(3 * alpha))
+                    dot = pygame.Surface((size * 2 + 1, size * 2 + 1))
+                    dot.fill(WHITE)
+                    dot.set_colorkey(WHITE)
+                    pygame.draw.circle(dot, color, (size, size), size)
+                    dots.append((dot, size))
+                cls.trail_sprites.append(dots)
+        return cls.trail_sprites
+    
+    def draw_trails(self, screen, offset_x=0):
+        """Draw every trail with one batched blit of pre-rendered dots"""
+        n = self.count
+        order, filled = self.get_trail_order()
+        arrows, slots = np.nonzero(filled)
+        if not len(arrows):
+            return
         
+        lengths = self.trail_length[:n][arrows]
+        ages = slots - (TRAIL_LENGTH - lengths)
+        xs = (self.trail_x[arrows, order[slots]] - offset_x).astype(int).tolist()
+        ys = self.trail_y[arrows, order[slots]].astype(int).tolist()
+        sprites = self.get_trail_sprites()
+        blits = []
+        for length, age, x, y in zip(lengths.tolist(), ages.tolist(), xs, ys):
+            dot, size = sprites[length][age]
+            blits.append((dot, (x - size, y - size)))
+        screen.blits(blits, doreturn=False)
+    
+    def draw(self, screen, interpolation=1.0, offset_x=0):
+        """Draw every arrow, blended between its last two steps by interpolation"""
+        n = self.count
+        xs = self.previous_x[:n] + (self.x[:n] - self.previous_x[:n]) * interpolation - offset_x
+        ys = self.previous_y[:n] + (self.y[:n] - self.previous_y[:n]) * interpolation
+        self.draw_trails(screen, offset_x)
+        
+        # Each arrow is a table lookup by its heading plus one batched blit
+        angles = np.arctan2(self.velocity_y[:n], self.velocity_x[:n])
+        rotations = (np.round(angles * (ARROW_ROTATIONS / (2 * math.pi))).astype(int) % ARROW_ROTATIONS).tolist()
+        lefts = (xs.astype(int) - ARROW_SPRITE_RADIUS).tolist()
+        tops = (ys.astype(int) - ARROW_SPRITE_RADIUS).tolist()
+        sprites = self.arrow_sprites
+        blits = []
+        for rotation, left, top in zip(rotations, lefts, tops):
+            sprite = sprites[rotation]
+            if sprite is None:
+                sprite = sprites[rotation] = self.render_arrow(rotation * 2 * math.pi / ARROW_ROTATIONS)
+            blits.append((sprite, (left, top)))
+        screen.blits(blits, doreturn=False)
+    
+    @staticmethod
+    def render_arrow(angle):
+        """Render an arrow pointing at angle into its own sprite"""
+        size = ARROW_SPRITE_RADIUS * 2 + 1
+        sprite = pygame.Surface((size, size))
+        sprite.fill(WHITE)
+        sprite.set_colorkey(WHITE)
+        ArrowBatch.draw_arrow(sprite, ARROW_SPRITE_RADIUS, ARROW_SPRITE_RADIUS, angle)
+        return sprite
+    
+    @staticmethod
+    def draw_arrow(screen, x, y, angle):
+        """Draw one arrow with better visibility"""
         # Draw arrow shaft (longer and more visible)
         arrow_length = 20
         shaft_width = 4
         
         # Arrow tip and tail positions
-        tip_x = self.x + arrow_length * 0.6 * math.cos(angle)
-        tip_y = self.y + arrow_length * 0.6 * math.sin(angle)
-        tail_x = self.x - arrow_length * 0.4 * math.cos(angle)
-        tail_y = self.y - arrow_length * 0.4 * math.sin(angle)
+        tip_x = x + arrow_length * 0.6 * math.cos(angle)
+        tip_y = y + arrow_length * 0.6 * math.sin(angle)
+        tail_x = x - arrow_length * 0.4 * math.cos(angle)
+        tail_y = y - arrow_length * 0.4 * math.sin(angle)
         
         # Draw arrow shaft (brown wooden part)
         pygame.draw.line(screen, BROWN, (int(tail_x), int(tail_y)), (int(tip_x), int(tip_y)), shaft_width)
         
         # Draw arrowhead (metal tip)
         head_length = 8
-        head_tip_x = self.x + (arrow_length * 0.6 + head_length) * math.cos(angle)
-        head_tip_y = self.y + (arrow_length * 0.6 + head_length) * math.sin(angle)
+        head_tip_x = x + (arrow_length * 0.6 + head_length) * math.cos(angle)
+        head_tip_y = y + (arrow_length * 0.6 + head_length) * math.sin(angle)
         
         # Arrowhead triangle
         perpendicular_angle = angle + math.pi / 2
@@ -278,82 +1152,233 @@ class Arrow:
                         (int(fletch_left_x), int(fletch_left_y)), 2)
         pygame.draw.line(screen, RED, (int(fletch_start_x), int(fletch_start_y)), 
                         (int(fletch_right_x), int(fletch_right_y)), 2)
+
+class Replay:
+    """Seed and input events of a match, enough to re-simulate it exactly
+    
+    The binary format is a header (magic, version, seed, end frame, event
+    count, player count, team count or 0 for free-for-all) followed by one
+    record per event: frame, action code and arrow type, then the mouse
+    position as two int16 for CHARGE/RELEASE or angle and power as two
+    doubles for SHOOT.
+    """
     
-    def get_rect(self):
-        """Get collision rectangle for arrow"""
-        return pygame.Rect(self.x - 3, self.y - 3, 6, 6)
+    HEADER = struct.Struct("<4sBIIIBB")
+    EVENT = struct.Struct("<IBB")
+    POSITION = struct.Struct("<hh")
+    SHOT = struct.Struct("<dd")
+    
+    def __init__(self, seed, events=None, end_frame=0, player_count=2, team_count=None):
+        self.seed = seed
+        self.player_count = player_count
+        self.team_count = team_count
+        self.events = events if events is not None else []  # (frame, Action) in order
+        self.end_frame = end_frame
+        self.by_frame = None
+    
+    def record(self, frame, action):
+        """Append an input applied at frame"""
+        self.events.append((frame, action))
+        self.by_frame = None
+    
+    def actions_at(self, frame):
+        """Get the actions that were applied at frame"""
+        if self.by_frame is None:
+            self.by_frame = {}
+            for event_frame, action in self.events:
+                self.by_frame.setdefault(event_frame, []).append(action)
+        return self.by_frame.get(frame, ())
+    
+    def create_world(self):
+        """Create a fresh world with this replay's seed and players"""
+        return World(self.seed, self.player_count, self.team_count)
+    
+    def simulate(self):
+        """Re-simulate the whole match headlessly and return the final world"""
+        world = self.create_world()
+        actions_at = self.actions_at
+        step = world.step
+        for frame in range(self.end_frame):
+            step(actions_at(frame))
+        return world
+    
+    def to_bytes(self):
+        """Encode the replay in the compact binary format"""
+        parts = [self.HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.seed, self.end_frame, len(self.events),
+                                  self.player_count, self.team_count or 0)]
+        for frame, action in self.events:
+            parts.append(self.EVENT.pack(frame, REPLAY_ACTION_CODES[action.kind], action.arrow))
+            if action.kind in (CHARGE, RELEASE):
+                parts.append(self.POSITION.pack(*action.pos))
+            elif action.kind == SHOOT:
+                parts.append(self.SHOT.pack(action.angle, action.power))
+        return b"".join(parts)
+    
+    @classmethod
+    def from_bytes(cls, data):
+        """Decode a replay produced by to_bytes"""
+        magic, version, seed, end_frame, count, player_count, team_count = cls.HEADER.unpack_from(data, 0)
+        if magic != REPLAY_MAGIC:
+            raise ValueError("Not a stickman archery replay")
+        if version != REPLAY_VERSION:
+            raise ValueError("Unsupported replay version %d (expected %d)" % (version, REPLAY_VERSION))
+        
+        offset = cls.HEADER.size
+        events = []
+        for _ in range(count):
+            frame, code, arrow = cls.EVENT.unpack_from(data, offset)
+            offset += cls.EVENT.size
+            kind = REPLAY_ACTION_KINDS[code]
+            if kind in (CHARGE, RELEASE):
+                action = Action(kind, pos=cls.POSITION.unpack_from(data, offset), arrow=arrow)
+                offset += cls.POSITION.size
+            elif kind == SHOOT:
+                angle, power = cls.SHOT.unpack_from(data, offset)
+                action = Action(kind, angle=angle, power=power, arrow=arrow)
+                offset += cls.SHOT.size
+            else:
+                action = Action(kind)
+            events.append((frame, action))
+        return cls(seed, events, end_frame, player_count, team_count or None)
+    
+    def save(self, path):
+        """Write the replay to a file"""
+        with open(path, "wb") as replay_file:
+            replay_file.write(self.to_bytes())
+    
+    @classmethod
+    def load(cls, path):
+        """Read a replay from a file"""
+        with open(path, "rb") as replay_file:
+            return cls.from_bytes(replay_file.read())
 
-class Game:
-    """Main game class that handles all game logic"""
+class World:
+    """Display-free game state that is advanced one fixed step at a time"""
     
-    def __init__(self):
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("Stickman Archery Game")
-        self.clock = pygame.time.Clock()
+    def __init__(self, seed=None, player_count=2, team_count=None, arrow_types=None):
+        if not 2 <= player_count <= MAX_PLAYERS:
+            raise ValueError(f"A match needs 2 to {MAX_PLAYERS} players")
+        if team_count is not None and not 2 <= team_count <= player_count:
+            raise ValueError("A team match needs 2 teams or more, and no more teams than players")
+        
+        # Every random choice in a match comes from one seeded generator
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # Inputs are recorded so the match can be replayed
+        self.replay = Replay(seed, player_count=player_count, team_count=team_count)
+        self.profiler = None  # Optional FrameProfiler timing each phase of step()
         
         # Initialize game objects
-        self.terrain = Terrain()
-        
-        # Position players on terrain
-        player1_x = 150
-        player1_y = self.terrain.get_height_at_x(player1_x) - 50
-        player2_x = SCREEN_WIDTH - 150
-        player2_y = self.terrain.get_height_at_x(player2_x) - 50
-        
-        self.player1 = Player(player1_x, player1_y, facing_right=True)
-        self.player2 = Player(player2_x, player2_y, facing_right=False)
+        self.terrain = Terrain(self.rng.randrange(2 ** 32))
+        
+        # Players take turns in id order, so dealing ids out to teams in
+        # rotation makes turns alternate between teams. Without teams every
+        # player is a team of their own, numbered like the player.
+        self.team_count = team_count
+        self.teams = [(player_id - 1) % (team_count or player_count) + 1 for player_id in range(1, player_count + 1)]
+        
+        # Spread players evenly over the terrain, teammates side by side, facing the middle
+        slots = sorted(range(player_count), key=lambda index: self.teams[index])
+        self.players = [None] * player_count
+        for slot, index in enumerate(slots):
+            x = PLAYER_MARGIN + (SCREEN_WIDTH - 2 * PLAYER_MARGIN) * slot // (player_count - 1)
+            y = self.terrain.get_height_at_x(x) - PLAYER_GROUND_OFFSET
+            self.players[index] = Player(x, y, facing_right=x < SCREEN_WIDTH // 2)
+        self.hitbox_key = None  # Player hitboxes the cached collision grid was built from
         
         # Game state
         self.current_player = 1
-        self.arrows = []
-        self.blood_particles = []  # Add blood particles list
+        self.turn = 0  # Turns taken so far, which numbers each turn's input for network play
+        self.arrow_types = arrow_types if arrow_types is not None else ArrowTypes.load()
+        self.arrow_table = self.arrow_types.compile()
+        self.arrows = ArrowBatch(table=self.arrow_table)
+        self.blood_particles = ParticleSystem(seed=seed)
         self.charging = False
         self.charge_power = 0
         self.charge_start_pos = None
+        self.frame = 0
         
         # Wind system
         self.wind_strength = 0
         self.wind_direction = 1  # 1 for right, -1 for left
         self.generate_new_wind()
         
-        # Fonts
-        self.font = pygame.font.Font(None, 36)
-        self.small_font = pygame.font.Font(None, 24)
-        
         # Game over state
         self.game_over = False
         self.winner = None
+        
+        # Every arrow fired and every arrow that struck a player, in order
+        self.shots = []
+        self.hits = []
+        self.landings = []  # End of every finished flight, pointing back into shots by index
+    
+    def get_current_player(self):
+        """Get the Player object whose turn it is"""
+        return self.players[self.current_player - 1]
+    
+    def get_team(self, player_id):
+        """Get the team a player belongs to"""
+        return self.teams[player_id - 1]
+    
+    def get_wind_force(self):
+        """Get the signed wind force of the current turn"""
+        return self.wind_strength * self.wind_direction
     
     def generate_new_wind(self):
         """Generate new wind conditions"""
-        self.wind_strength = random.uniform(0, 3)
-        self.wind_direction = random.choice([-1, 1])
+        self.wind_strength = self.rng.uniform(0, 3)
+        self.wind_direction = self.rng.choice([-1, 1])
     
-    def handle_events(self):
-        """Handle all game events"""
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                return False
-            
-            if self.game_over:
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_r:
-                        self.restart_game()
-                continue
-            
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if event.button == 1:  # Left mouse button
-                    self.start_charging(pygame.mouse.get_pos())
-            
-            elif event.type == pygame.MOUSEBUTTONUP:
-                if event.button == 1 and self.charging:
-                    self.shoot_arrow(pygame.mouse.get_pos())
-            
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_SPACE:
-                    self.switch_turn()
+    def apply_action(self, action):
+        """Apply a single player input to the world"""
+        if self.game_over:
+            return
         
-        return True
+        if action.kind == CHARGE:
+            self.start_charging(action.pos)
+        elif action.kind == RELEASE:
+            self.shoot_arrow(action.pos, action.arrow)
+        elif action.kind == SHOOT:
+            self.fire(action.angle, action.power, action.arrow)
+        elif action.kind == SKIP:
+            self.switch_turn()
+    
+    def step(self, actions=()):
+        """Apply this step's actions and advance the simulation by one frame"""
+        profiler = self.profiler
+        for action in actions:
+            self.replay.record(self.frame, action)
+            self.apply_action(action)
+        if profiler is not None:
+            profiler.mark("sim_actions")
+        
+        if not self.game_over:
+            self.update_charging()
+            if profiler is not None:
+                profiler.mark("sim_charging")
+            self.update_arrows()
+            if profiler is not None:
+                profiler.mark("sim_arrows")
+            self.update_blood_particles()
+            if profiler is not None:
+                profiler.mark("sim_particles")
+        
+        self.frame += 1
+        self.replay.end_frame = self.frame
+    
+    def is_settled(self):
+        """Check if no arrow is in flight and nobody is charging"""
+        return not self.arrows and not self.charging
+    
+    def run_until_settled(self, max_frames=1000):
+        """Step without input until all arrows have landed, return frames used"""
+        frames = 0
+        while not self.is_settled() and not self.game_over and frames < max_frames:
+            self.step()
+            frames += 1
+        return frames
     
     def start_charging(self, mouse_pos):
         """Start charging the arrow shot"""
@@ -362,64 +1387,83 @@ class Game:
             self.charge_start_pos = mouse_pos
             self.charge_power = 0
     
-    def shoot_arrow(self, mouse_pos):
-        """Shoot arrow based on mouse position and charge"""
+    def shoot_arrow(self, mouse_pos, arrow=0):
+        """Shoot an arrow of type arrow based on mouse position and charge"""
         if not self.charging:
             return
         
-        current_player_obj = self.player1 if self.current_player == 1 else self.player2
+        angle = self.get_aim_angle(mouse_pos)
+        power = self.charge_power
+        
+        # Reset charging
+        self.charging = False
+        self.charge_power = 0
         
-        # Calculate angle and power
+        self.fire(angle, power, arrow)
+    
+    def get_aim_angle(self, mouse_pos):
+        """Get the angle from the current player towards the mouse"""
+        current_player_obj = self.get_current_player()
         dx = mouse_pos[0] - current_player_obj.x
         dy = mouse_pos[1] - current_player_obj.y
+        return math.atan2(dy, dx)
+    
+    def get_launch(self, angle, power, arrow=0):
+        """Get the start position and velocity of the current player's arrow of type arrow"""
+        current_player_obj = self.get_current_player()
         
-        # Prevent shooting if power is too low (fixes the instant hit bug)
-        if self.charge_power < 1:
-            self.charging = False
-            self.charge_power = 0
-            return
-        
-        angle = math.atan2(dy, dx)
-        
-        # Calculate velocity based on charge power
-        power = min(self.charge_power, MAX_POWER)
-        velocity_x = power * math.cos(angle)
-        velocity_y = power * math.sin(angle)
+        # Calculate velocity based on charge power and how fast the type flies
+        speed = power * self.arrow_table.speed[arrow]
+        velocity_x = speed * math.cos(angle)
+        velocity_y = speed * math.sin(angle)
         
         # Start arrow slightly away from player to prevent immediate collision
-        start_offset = 30
-        start_x = current_player_obj.x + start_offset * math.cos(angle)
-        start_y = current_player_obj.y - 20 + start_offset * math.sin(angle)
+        start_x = current_player_obj.x + ARROW_START_OFFSET * math.cos(angle)
+        start_y = current_player_obj.y - ARROW_START_HEIGHT + ARROW_START_OFFSET * math.sin(angle)
+        return start_x, start_y, velocity_x, velocity_y
+    
+    def fire(self, angle, power, arrow=0):
+        """Launch an arrow of type arrow for the current player, return True if it was shot"""
+        # Prevent shooting if power is too low (fixes the instant hit bug)
+        if power < 1 or self.game_over or not 0 <= arrow < len(self.arrow_table):
+            return False
         
-        # Create arrow with shooter ID
-        arrow = Arrow(start_x, start_y, velocity_x, velocity_y, self.current_player)
-        self.arrows.append(arrow)
+        power = min(power, MAX_POWER)
+        start_x, start_y, velocity_x, velocity_y = self.get_launch(angle, power, arrow)
         
-        # Reset charging
-        self.charging = False
-        self.charge_power = 0
+        # Create arrow with shooter ID, flying in the wind shown for this turn
+        wind = self.get_wind_force()
+        self.arrows.spawn(start_x, start_y, velocity_x, velocity_y, self.current_player, wind, arrow, len(self.shots))
+        self.shots.append(Shot(self.frame, self.current_player, angle, power, wind, arrow))
         
         # Switch turns after shooting
         self.switch_turn()
+        return True
     
     def create_blood_effect(self, x, y, is_headshot=False):
         """Create blood particle effect at hit location"""
         particle_count = 15 if is_headshot else 10
-        for _ in range(particle_count):
-            self.blood_particles.append(BloodParticle(x, y))
+        self.blood_particles.emit(x, y, particle_count)
     
     def update_blood_particles(self):
         """Update all blood particles"""
-        for particle in self.blood_particles[:]:
-            particle.update()
-            if not particle.is_alive():
-                self.blood_particles.remove(particle)
+        self.blood_particles.update()
     
     def switch_turn(self):
-        """Switch to the other player's turn"""
-        self.current_player = 2 if self.current_player == 1 else 1
+        """Switch to the next living player's turn"""
+        self.current_player = self.get_next_player()
+        self.turn += 1
         self.generate_new_wind()
     
+    def get_next_player(self):
+        """Get the id of the first living player after the current one, in turn order"""
+        count = len(self.players)
+        for offset in range(1, count + 1):
+            player_id = (self.current_player + offset - 1) % count + 1
+            if self.players[player_id - 1].is_alive():
+                return player_id
+        return self.current_player
+    
     def update_charging(self):
         """Update charging power"""
         if self.charging:
@@ -427,99 +1471,998 @@ class Game:
             if self.charge_power > MAX_POWER:
                 self.charge_power = MAX_POWER
     
+    def get_hitbox_grid(self):
+        """Get living players' hitboxes, their SpatialHash, each row's owner and whether it is a head
+        
+        Rows are head then body for each player, so heads win ties. The
+        hitboxes are only rebuilt when a player moved or died, and the grid
+        is None when there are too few boxes for it to pay off.
+        """
+        hitboxes = tuple(player.get_hitboxes() if player.is_alive() else () for player in self.players)
+        if hitboxes != self.hitbox_key:
+            self.hitbox_key = hitboxes
+            living = [player_id for player_id, boxes in enumerate(hitboxes, 1) if boxes]
+            self.hitbox_array = np.array([box for boxes in hitboxes for box in boxes], dtype=float)
+            self.hitbox_grid = SpatialHash(self.hitbox_array) if len(self.hitbox_array) >= SPATIAL_MIN_BOXES else None
+            self.hitbox_owners = np.repeat(living, 2)
+            self.hitbox_heads = np.tile([True, False], len(living))
+            # The same boxes and owners as lists, for ArrowBatch.step_few
+            self.hitbox_list = self.hitbox_array.tolist()
+            self.hitbox_owner_list = self.hitbox_owners.tolist()
+        return self.hitbox_array, self.hitbox_grid, self.hitbox_owners, self.hitbox_heads
+    
     def update_arrows(self):
         """Update all arrows and check for collisions"""
-        wind_force = self.wind_strength * self.wind_direction
+        arrows = self.arrows
+        if not arrows:
+            return
+        table = self.arrow_table
+        
+        # Split arrows burst once they start to fall
+        if arrows.special_count:
+            n = arrows.count
+            splitting = np.flatnonzero((table.split[arrows.kind[:n]] > 0) & (arrows.velocity_y[:n] >= 0))
+            if len(splitting):
+                arrows.split(splitting)
+        
+        n = arrows.count
+        hitboxes, grid, owners, heads = self.get_hitbox_grid()
+        if n <= SMALL_ARROW_BATCH:
+            # A few arrows are cheaper to step one by one, and most steps end
+            # here with every arrow still in the air
+            start_x, start_y, hit_time, box, box_time = arrows.step_few(self.terrain, self.hitbox_list,
+                                                                        self.hitbox_owner_list)
+            if min(hit_time + box_time) == math.inf and max(arrows.y[:n].tolist()) <= SCREEN_HEIGHT:
+                return
+            start_x, start_y, hit_time, box_time = (np.array(values) for values in (start_x, start_y, hit_time,
+                                                                                    box_time))
+            box = np.array(box)
+        else:
+            start_x, start_y = arrows.advance()
+            
+            # Sweep each arrow's step against the terrain and the hitboxes it may touch,
+            # keeping the earliest contact so fast arrows cannot tunnel through targets
+            hit_time = arrows.sweep_terrain(self.terrain, start_x, start_y)
+            rows, boxes, contact = arrows.sweep_boxes(start_x, start_y, hitboxes, grid)
+            contact[arrows.shooter[rows] == owners[boxes]] = np.inf  # Arrows can't hit their shooter
+            
+            # Each arrow's first contact, the lowest row winning ties
+            box = np.zeros(n, dtype=int)
+            box_time = np.full(n, np.inf)
+            if len(rows):
+                order = np.lexsort((boxes, contact, rows))
+                first = order[np.r_[True, rows[order[1:]] != rows[order[:-1]]]]
+                box[rows[first]] = boxes[first]
+                box_time[rows[first]] = contact[first]
+        struck = box_time < hit_time
+        hit_time = np.where(struck, box_time, hit_time)
+        
+        # Apply damage for every arrow that struck a player
+        for i in np.flatnonzero(struck).tolist():
+            target = int(owners[box[i]])
+            kind = int(arrows.kind[i])
+            player = self.players[target - 1]
+            headshot = bool(heads[box[i]])
+            hit_x = start_x[i] + (arrows.x[i] - start_x[i]) * hit_time[i]
+            hit_y = start_y[i] + (arrows.y[i] - start_y[i]) * hit_time[i]
+            self.hits.append(Hit(self.frame, int(arrows.shooter[i]), headshot, float(hit_x), float(hit_y)))
+            health = player.health
+            if headshot:
+                player.take_damage(table.head_damage[kind])
+                self.create_blood_effect(player.x, player.y - 40, True)
+            else:
+                player.take_damage(table.body_damage[kind])
+                self.create_blood_effect(player.x, player.y - 20, False)
+            self.landings.append(Landing(self.frame, int(arrows.shot[i]), ZONE_HEAD if headshot else ZONE_BODY,
+                                         target, health - player.health))
+            self.check_game_over()
+        
+        # Arrows that hit the ground carve a crater where they land
+        landed = np.flatnonzero(np.isfinite(hit_time) & ~struck)
+        if len(landed):
+            impact_x = start_x[landed] + (arrows.x[landed] - start_x[landed]) * hit_time[landed]
+            impact_y = start_y[landed] + (arrows.y[landed] - start_y[landed]) * hit_time[landed]
+            craters = [table.crater[kind] for kind in arrows.kind[landed].tolist()]
+            for x, y, radius in zip(impact_x.tolist(), impact_y.tolist(), craters):
+                self.terrain.carve(x, y, radius)
+            self.settle_players()
+            self.landings.extend(Landing(self.frame, shot, ZONE_GROUND, 0, 0) for shot in arrows.shot[landed].tolist())
+        
+        # Explosive arrows also hurt everyone near where they struck or landed
+        if arrows.special_count:
+            exploding = np.isfinite(hit_time) & (table.blast_radius[arrows.kind[:n]] > 0)
+            for i in np.flatnonzero(exploding).tolist():
+                x = start_x[i] + (arrows.x[i] - start_x[i]) * hit_time[i]
+                y = start_y[i] + (arrows.y[i] - start_y[i]) * hit_time[i]
+                struck_id = int(owners[box[i]]) if struck[i] else 0
+                self.explode(float(x), float(y), int(arrows.kind[i]), int(arrows.shooter[i]), int(arrows.shot[i]),
+                             struck_id)
+        
+        # Remove arrows that hit something or fell below the world; the terrain
+        # has no sideways end, so every arrow eventually comes down on it
+        flying = np.isinf(hit_time)
+        lost = flying & (arrows.y[:n] > SCREEN_HEIGHT)
+        if lost.any():
+            self.landings.extend(Landing(self.frame, shot, ZONE_LOST, 0, 0) for shot in arrows.shot[:n][lost].tolist())
+        arrows.compact(flying & ~lost)
+    
+    def explode(self, x, y, kind, shooter, shot, struck):
+        """Deal an explosive arrow's blast damage to the living players within its radius of (x, y)
+        
+        Neither the shooter nor the player the arrow struck, who already took
+        the hit, is caught in the blast.
+        """
+        radius = self.arrow_table.blast_radius[kind]
+        damage = self.arrow_table.blast_damage[kind]
+        for player_id, player in enumerate(self.players, 1):
+            if player_id in (shooter, struck) or not player.is_alive():
+                continue
+            # Distance to the middle of the body
+            if math.hypot(player.x - x, player.y - player.body_height / 2 - y) > radius:
+                continue
+            health = player.health
+            player.take_damage(damage)
+            self.create_blood_effect(player.x, player.y - 20, False)
+            self.landings.append(Landing(self.frame, shot, ZONE_BLAST, player_id, health - player.health))
+        self.check_game_over()
+    
+    def settle_players(self):
+        """Drop players whose ground was carved away back onto the terrain"""
+        for player in self.players:
+            ground_y = self.terrain.get_height_at_x(player.x) - PLAYER_GROUND_OFFSET
+            if ground_y > player.y:
+                player.y = ground_y
+    
+    def check_game_over(self):
+        """End the match once one team or nobody is left standing"""
+        standing = {team for team, player in zip(self.teams, self.players) if player.is_alive()}
+        if len(standing) <= 1:
+            self.game_over = True
+            self.winner = standing.pop() if standing else None
+        elif not self.get_current_player().is_alive():
+            # A player killed before their turn came round is passed over
+            self.current_player = self.get_next_player()
+
+class AIArcher:
+    """Computer-controlled archer that solves the flight equations for its shot
+    
+    At whole frames an arrow's position has a closed form, since gravity and
+    wind are constant accelerations. For every candidate launch angle this
+    gives the exact power that passes through the target. All angles are
+    solved at once as NumPy arrays, and only those whose path clears the
+    terrain are kept. If the target is out of range, the AI fires at full
+    power at whichever angle gets closest. Difficulty then adds aiming error.
+    The AI always shoots arrows of one type, whose physics it solves for.
+    """
+    
+    def __init__(self, player_id, difficulty="medium", rng=None, arrow=0):
+        self.player_id = player_id
+        self.difficulty = difficulty
+        self.arrow = arrow  # Index of the arrow type shot
+        self.angle_error, self.power_error = AI_DIFFICULTIES[difficulty]
+        self.rng = rng if rng is not None else random.Random()
+        self.frames = np.arange(AI_MAX_FLIGHT_FRAMES + 1, dtype=float)
+    
+    def get_shooter(self, world):
+        """Get the Player this AI controls"""
+        return world.players[self.player_id - 1]
+    
+    def get_opponent(self, world):
+        """Get the nearest living player of another team"""
+        shooter = self.get_shooter(world)
+        team = world.get_team(self.player_id)
+        enemies = [player for player_id, player in enumerate(world.players, 1)
+                   if player.is_alive() and world.get_team(player_id) != team]
+        return min(enemies, key=lambda player: abs(player.x - shooter.x))
+    
+    def get_target(self, world):
+        """Pick the point on the opponent to aim at"""
+        opponent = self.get_opponent(world)
+        if self.difficulty == "hard":
+            head = opponent.get_head_rect()
+            return head.centerx, head.centery
+        body = opponent.get_body_rect()
+        return body.centerx, body.centery
+    
+    def get_candidate_angles(self, world, target):
+        """Get launch angles from straight up to just below horizontal towards the target"""
+        towards = 0.3 if target[0] >= self.get_shooter(world).x else -math.pi - 0.3
+        return np.linspace(-math.pi / 2, towards, AI_ANGLES)
+    
+    def trace(self, world, angles, powers, check_peaks=False, frame_count=AI_MAX_FLIGHT_FRAMES):
+        """Get positions for frame_count frames and the frame each flight ends on
+        
+        With check_peaks the ground is also tested wherever the straight path
+        between two frames passes over a terrain point, so a hill top between
+        frames can't be missed the way plain per-frame samples would.
+        """
+        shooter = self.get_shooter(world)
+        angles = angles[:, None]
+        powers = powers[:, None]
+        cos = np.cos(angles)
+        sin = np.sin(angles)
+        
+        # Launch state exactly as World.get_launch computes it
+        table = world.arrow_table
+        speeds = powers * table.speed[self.arrow]
+        xs, ys = flight_path(shooter.x + ARROW_START_OFFSET * cos,
+                             shooter.y - ARROW_START_HEIGHT + ARROW_START_OFFSET * sin,
+                             speeds * cos, speeds * sin, world.get_wind_force(), self.frames[:frame_count + 1],
+                             table.gravity[self.arrow], table.wind[self.arrow])
+        
+        # Flight ends on the first frame that is in the ground or below the world
+        ended = ys > SCREEN_HEIGHT
+        ended[:, 0] = False
+        ended[:, -1] = True
+        landing = ended.argmax(axis=1)
+        
+        # Ground hits count from the frame whose step first touched the ground
+        grounded = ys[:, 1:] >= world.terrain.get_heights_at(xs[:, 1:]) - AI_GROUND_MARGIN
+        if check_peaks:
+            # Terrain is straight between columns, so its ridges are the only other places to test
+            point_x, point_y = world.terrain.get_ridges(xs.min(), xs.max())
+            start_x = xs[:, :-1, None]
+            step_x = np.diff(xs, axis=1)[:, :, None]
+            step_x[step_x == 0] = 1e-9
+            crossing = (point_x - start_x) / step_x
+            crossing_y = ys[:, :-1, None] + np.diff(ys, axis=1)[:, :, None] * crossing
+            over_peak = (crossing >= 0) & (crossing <= 1) & (crossing_y >= point_y - AI_GROUND_MARGIN)
+            grounded |= over_peak.any(axis=2)
+        hit_ground = grounded.any(axis=1)
+        landing = np.where(hit_ground, np.minimum(landing, grounded.argmax(axis=1) + 1), landing)
+        return xs, ys, landing
+    
+    def solve(self, world):
+        """Find the angle and power that best hit the target, ignoring difficulty"""
+        shooter = self.get_shooter(world)
+        target_x, target_y = self.get_target(world)
+        angles = self.get_candidate_angles(world, (target_x, target_y))
+        cos = np.cos(angles)
+        tan = np.tan(angles)
+        table = world.arrow_table
+        wind = world.get_wind_force() * table.wind[self.arrow]
+        
+        # Eliminating power from x(n) and y(n) leaves a linear equation in ramp(n)
+        dx = target_x - (shooter.x + ARROW_START_OFFSET * cos)
+        dy = target_y - (shooter.y - ARROW_START_HEIGHT + ARROW_START_OFFSET * np.sin(angles))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ramp = (dy - tan * dx) / (table.gravity[self.arrow] - wind * tan)
+            arrival = (np.sqrt(1 + 8 * ramp) - 1) / 2  # Frames until the target is reached
+            powers = (dx - wind * ramp) / (cos * arrival * table.speed[self.arrow])
+        
+        reachable = (arrival > 0) & (arrival < AI_MAX_FLIGHT_FRAMES) & (powers >= 1) & (powers <= MAX_POWER)
+        if reachable.any():
+            shot_angles = angles[reachable]
+            shot_powers = powers[reachable]
+            arrival = arrival[reachable]
+            
+            # Keep shots whose flight doesn't end before reaching the target
+            arrival_frames = np.ceil(arrival)
+            _, _, landing = self.trace(world, shot_angles, shot_powers, True, int(arrival_frames.max()))
+            clear = landing >= arrival_frames
+            if clear.any():
+                # The quickest flight is the flattest and least exposed to error
+                best = np.flatnonzero(clear)[arrival[clear].argmin()]
+                return float(shot_angles[best]), float(shot_powers[best])
+        
+        # Out of range, or every solution is blocked: fire at full power at the angle that gets closest.
+        # Angles are ranked on plain per-frame samples and checked against hill tops a few at a time, best
+        # first. A hill top can only end a flight sooner, so once a checked angle gets closer than the next
+        # ranking, no angle left can beat it.
+        powers = np.full(len(angles), float(MAX_POWER))
+        xs, ys, landing = self.trace(world, angles, powers)
+        distance = self.get_closest_distance(xs, ys, landing, target_x, target_y)
+        ranked = np.argsort(distance, kind="stable")
+        best = None
+        best_distance = np.inf
+        for start in range(0, len(ranked), AI_FALLBACK_CANDIDATES):
+            if distance[ranked[start]] >= best_distance:
+                break
+            batch = ranked[start:start + AI_FALLBACK_CANDIDATES]
+            xs, ys, batch_landing = self.trace(world, angles[batch], powers[batch], True, int(landing[batch].max()))
+            checked = self.get_closest_distance(xs, ys, batch_landing, target_x, target_y)
+            if checked.min() < best_distance:
+                best = batch[checked.argmin()]
+                best_distance = checked.min()
+        return float(angles[best]), float(MAX_POWER)
+    
+    def get_closest_distance(self, xs, ys, landing, target_x, target_y):
+        """Get how close each traced flight comes to the target before it ends"""
+        in_flight = self.frames[None, :xs.shape[1]] <= landing[:, None]
+        return np.where(in_flight, np.hypot(xs - target_x, ys - target_y), np.inf).min(axis=1)
+    
+    def choose_shot(self, world):
+        """Get the (angle, power) to shoot with, including aiming error"""
+        angle, power = self.solve(world)
+        angle += self.rng.gauss(0, self.angle_error)
+        power += self.rng.gauss(0, self.power_error)
+        return angle, max(1.0, min(MAX_POWER, power))
+    
+    def get_action(self, world):
+        """Get a SHOOT action for the current turn"""
+        angle, power = self.choose_shot(world)
+        return Action(SHOOT, angle=angle, power=power, arrow=self.arrow)
+
+def self_play(seed=None, difficulties=("medium", "medium"), max_turns=200, team_count=None, arrow=0):
+    """Play a headless match between AI archers, one per difficulty, and return the final world
+    
+    Every archer shoots arrows of the type at index arrow.
+    """
+    world = World(seed, len(difficulties), team_count)
+    ai_rng = random.Random(world.seed)
+    archers = {player_id: AIArcher(player_id, difficulty, random.Random(ai_rng.random()), arrow)
+               for player_id, difficulty in enumerate(difficulties, 1)}
+    
+    turns = 0
+    while not world.game_over and turns < max_turns:
+        world.step([archers[world.current_player].get_action(world)])
+        world.run_until_settled()
+        turns += 1
+    return world
+
+class TextCache:
+    """Bounded LRU cache of rendered text surfaces keyed by (font, text, color)"""
+    
+    def __init__(self, max_size=TEXT_CACHE_SIZE):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def render(self, font, text, color):
+        """Get an antialiased surface for text, rendering it only on a miss"""
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        
+        self.misses += 1
+        surface = font.render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)  # Evict the least recently used
+        return surface
+    
+    def clear(self):
+        """Drop all cached surfaces"""
+        self.surfaces.clear()
+    
+    def get_stats(self):
+        """Get hit/miss counters and the current size"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.surfaces),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+class TrajectoryPreview:
+    """Predicted flight of the shot being charged, cached per quantized aim
+    
+    Arcs come from the closed-form flight_path and end where they first meet
+    the ground or leave the screen. Angle and power are quantized for the
+    cache key, so an arc is only recomputed when the aim, power or wind
+    really changes, however often it is drawn.
+    """
+    
+    def __init__(self, max_size=PREVIEW_CACHE_SIZE):
+        self.max_size = max_size
+        self.arcs = OrderedDict()
+        self.terrain = None
+        self.revision = None
+        self.frames = np.arange(PREVIEW_FRAMES + 1, dtype=float)
+    
+    def get_arc(self, world, angle, power, arrow=0):
+        """Get the arc's points and bounding rectangle for a shot of arrow type arrow by the current player"""
+        # Arcs are only valid for the terrain they were cut against
+        terrain = world.terrain
+        if terrain is not self.terrain or terrain.revision != self.revision:
+            self.arcs.clear()
+            self.terrain = terrain
+            self.revision = terrain.revision
+        
+        angle_step = round(angle / PREVIEW_ANGLE_STEP)
+        power_step = round(min(power, MAX_POWER) / PREVIEW_POWER_STEP)
+        shooter = world.get_current_player()
+        key = (shooter.x, shooter.y, angle_step, power_step, world.get_wind_force(), arrow)
+        arc = self.arcs.get(key)
+        if arc is not None:
+            self.arcs.move_to_end(key)
+            return arc
+        
+        arc = self.compute(world, angle_step * PREVIEW_ANGLE_STEP, power_step * PREVIEW_POWER_STEP, arrow)
+        self.arcs[key] = arc
+        if len(self.arcs) > self.max_size:
+            self.arcs.popitem(last=False)  # Evict the least recently used
+        return arc
+    
+    def compute(self, world, angle, power, arrow=0):
+        """Trace a shot until it lands and return its points and bounding rectangle
+        
+        Split arrows are traced as if they never split.
+        """
+        table = world.arrow_table
+        start_x, start_y, velocity_x, velocity_y = world.get_launch(angle, power, arrow)
+        xs, ys = flight_path(start_x, start_y, velocity_x, velocity_y, world.get_wind_force(), self.frames,
+                             table.gravity[arrow], table.wind[arrow])
+        
+        # Cut the arc at the first frame in the ground or below the world
+        depth = ys - world.terrain.get_heights_at(xs)
+        ended = (depth >= 0) | (ys > SCREEN_HEIGHT)
+        ended[0] = False
+        end = int(ended.argmax()) if ended.any() else len(xs) - 1
+        xs = xs[:end + 1]
+        ys = ys[:end + 1]
+        
+        # Land the last point on the ground where the step crossed it
+        if depth[end] >= 0 and depth[end - 1] < 0:
+            fraction = depth[end - 1] / (depth[end - 1] - depth[end])
+            xs[end] = xs[end - 1] + (xs[end] - xs[end - 1]) * fraction
+            ys[end] = ys[end - 1] + (ys[end] - ys[end - 1]) * fraction
+        
+        points = tuple(zip(xs.astype(int).tolist(), ys.astype(int).tolist()))
+        left = xs.min()
+        top = ys.min()
+        rect = pygame.Rect(int(left), int(top), int(xs.max() - left) + 1, int(ys.max() - top) + 1).inflate(4, 4)
+        return points, rect
+    
+    def clear(self):
+        """Drop all cached arcs"""
+        self.arcs.clear()
+
+class DirtyRectTracker:
+    """Remembers what was drawn where so a frame only repaints what changed
+    
+    Every frame is described as a list of (name, signature, rects) entries
+    in draw order. An entry is repainted when its signature differs from the
+    last frame (None means it changes every frame) or when it overlaps an
+    area that has to be repainted anyway.
+    """
+    
+    def __init__(self):
+        self.previous = {}
+    
+    def reset(self):
+        """Forget the last frame, e.g. after the whole screen was redrawn"""
+        self.previous = {}
+    
+    def plan(self, elements, extra_dirty=()):
+        """Get the names to redraw and the screen rectangles to repaint, including extra_dirty"""
+        current = {name: (signature, rects) for name, signature, rects in elements}
+        redraw = set()
+        dirty = list(extra_dirty)
+        
+        # Areas left behind by entries that changed or disappeared
+        for name, (signature, rects) in self.previous.items():
+            entry = current.get(name)
+            if entry is None or signature is None or entry[0] != signature or entry[1] != rects:
+                dirty.extend(rects)
+        
+        # Entries that changed paint their new area
+        for name, signature, rects in elements:
+            old = self.previous.get(name)
+            if old is None or signature is None or old[0] != signature or old[1] != rects:
+                redraw.add(name)
+                dirty.extend(rects)
+        
+        # Unchanged entries that overlap a repainted area must be drawn again
+        grown = True
+        while grown:
+            grown = False
+            for name, signature, rects in elements:
+                if name not in redraw and any(rect.collidelist(dirty) != -1 for rect in rects):
+                    redraw.add(name)
+                    dirty.extend(rects)
+                    grown = True
+        
+        self.previous = current
+        return redraw, dirty
+
+class FrameProfiler:
+    """Times each phase of every frame for an on-screen overlay and a log file
+    
+    Code calls mark(phase) when it finishes a phase and the time since the
+    previous mark is charged to that phase. The log is CSV, or one JSON
+    object per line when the path ends in .json or .jsonl.
+    """
+    
+    def __init__(self, output_path=None, show_overlay=True):
+        self.show_overlay = show_overlay
+        self.phases = {}
+        self.history = deque(maxlen=PROFILE_HISTORY)
+        self.frame = 0
+        self.frame_start = self.last_mark = time.perf_counter()
+        
+        self.output = open(output_path, "w", newline="") if output_path else None
+        self.json_output = bool(output_path) and output_path.endswith((".json", ".jsonl"))
+        self.csv_writer = None
+        
+        # The overlay is re-rendered only every PROFILE_OVERLAY_INTERVAL frames
+        self.overlay_surface = None
+        self.overlay_version = 0
+    
+    def begin_frame(self):
+        """Start timing a new frame"""
+        self.frame_start = self.last_mark = time.perf_counter()
+        self.phases = {}
+    
+    def mark(self, phase):
+        """Charge the time since the previous mark to phase"""
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last_mark
+        self.last_mark = now
+    
+    def end_frame(self, counts):
+        """Finish the frame, recording its phase times and entity counts"""
+        record = {"frame": self.frame, "total_ms": (self.last_mark - self.frame_start) * 1000}
+        for phase in PROFILE_PHASES:
+            record[phase + "_ms"] = self.phases.get(phase, 0.0) * 1000
+        record.update(counts)
+        self.history.append(record)
+        
+        if self.output is not None:
+            self.write(record)
+        
+        self.frame += 1
+        if self.frame % PROFILE_OVERLAY_INTERVAL == 0:
+            self.overlay_surface = None
+            self.overlay_version += 1
+    
+    def write(self, record):
+        """Append one frame record to the log"""
+        if self.json_output:
+            self.output.write(json.dumps(record) + "\n")
+            return
         
-        for arrow in self.arrows[:]:  # Create copy to safely remove items
-            if not arrow.active:
+        if self.csv_writer is None:
+            self.csv_writer = csv.DictWriter(self.output, fieldnames=list(record))
+            self.csv_writer.writeheader()
+        self.csv_writer.writerow(record)
+    
+    def get_averages(self):
+        """Average every recorded value over the recent frames"""
+        if not self.history:
+            return {}
+        
+        totals = {}
+        for record in self.history:
+            for key, value in record.items():
+                totals[key] = totals.get(key, 0) + value
+        return {key: value / len(self.history) for key, value in totals.items()}
+    
+    def get_overlay_rect(self):
+        """Get the screen area covered by the overlay"""
+        return pygame.Rect(10, SCREEN_HEIGHT - PROFILE_OVERLAY_SIZE[1] - 10, *PROFILE_OVERLAY_SIZE)
+    
+    def draw(self, screen, font):
+        """Draw recent average timings and counts in the bottom left corner"""
+        if self.overlay_surface is None:
+            self.overlay_surface = self.render_overlay(font)
+        screen.blit(self.overlay_surface, self.get_overlay_rect())
+    
+    def render_overlay(self, font):
+        """Render the overlay text onto a translucent panel"""
+        averages = self.get_averages()
+        total = averages.get("total_ms", 0.0)
+        lines = [f"frame {total:6.2f} ms ({1000 / total if total else 0:.0f} fps)"]
+        for phase in PROFILE_PHASES:
+            value = averages.get(phase + "_ms", 0.0)
+            if value > 0:
+                lines.append(f"{phase:<16}{value:6.2f} ms")
+        for count in PROFILE_COUNTS:
+            lines.append(f"{count:<16}{averages.get(count, 0):6.0f}")
+        
+        panel = pygame.Surface(PROFILE_OVERLAY_SIZE, pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 160))
+        for i, line in enumerate(lines):
+            panel.blit(font.render(line, True, WHITE), (8, 6 + i * 16))
+        return panel
+    
+    def close(self):
+        """Flush and close the log"""
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+
+class Camera:
+    """Horizontal view into the world that follows arrows once they near the screen edge
+    
+    The home view at x = 0 shows every archer. The camera moves a fraction
+    of the way to its target every step, lingers briefly where the last
+    arrow landed and then drifts back home.
+    """
+    
+    def __init__(self):
+        self.x = 0.0  # World x at the left edge of the screen
+        self.previous_x = 0.0
+        self.target = 0.0
+        self.hold = 0  # Steps left to stay on the last arrow's target
+    
+    def follow(self, world):
+        """Move one step towards the arrow in flight, or back home once it is gone"""
+        self.previous_x = self.x
+        arrows = world.arrows
+        if arrows:
+            # Keep the oldest arrow at least CAMERA_MARGIN inside the screen. Removals
+            # reorder the batch, so the oldest is the one with the smallest id.
+            arrow_x = float(arrows.x[arrows.ids[:arrows.count].argmin()])
+            self.target = min(0.0, arrow_x - CAMERA_MARGIN) + max(0.0, arrow_x - (SCREEN_WIDTH - CAMERA_MARGIN))
+            self.hold = CAMERA_HOLD_FRAMES
+        elif self.hold > 0:
+            self.hold -= 1
+        else:
+            self.target = 0.0
+        
+        self.x += (self.target - self.x) * CAMERA_SMOOTHING
+        if abs(self.target - self.x) < 0.5:
+            self.x = self.target
+    
+    def get_offset(self, interpolation=1.0):
+        """Get the whole-pixel view position, blended between the last two steps"""
+        return round(self.previous_x + (self.x - self.previous_x) * interpolation)
+
+class Game:
+    """Renders a World and feeds it mouse and keyboard input
+    
+    Only the display and font modules of pygame are started, on first use.
+    The window, fonts and overlay are shared by every Game in the process,
+    so creating another game or restarting one reloads nothing.
+    """
+    
+    display_vsync = None  # Vsync setting of the open window
+    fonts = {}  # Default font by size
+    game_over_overlay = None  # Translucent layer under the game over text, built on first use
+    
+    def __init__(self, dirty_rects=False, fps_limit=FPS, vsync=False, seed=None, playback=None,
+                 record_path=None, profiler=None, ai_difficulty=None, network=None, player_count=2, team_count=None):
+        self.screen = self.create_display(vsync)
+        pygame.display.set_caption("Stickman Archery Game")
+        if network is not None:
+            pygame.display.set_caption(f"Stickman Archery Game - Player {network.player_id}")
+        self.clock = pygame.time.Clock()
+        self.fps_limit = fps_limit  # 0 renders as fast as possible
+        self.interpolation = 1.0
+        
+        # Simulation state lives in the world, input is queued per frame
+        self.playback = playback  # Replay whose inputs drive the world instead of the mouse
+        self.record_path = record_path  # Where the latest match's replay is saved
+        self.player_count = player_count
+        self.team_count = team_count
+        self.world = playback.create_world() if playback else World(seed, player_count, team_count)
+        self.actions = []
+        self.arrow = 0  # Index of the arrow type the local player has chosen
+        
+        # Optional computer opponents playing everyone but player 1
+        self.ai_difficulty = ai_difficulty if playback is None else None
+        self.ais = {}  # AIArcher by the id of the player it controls
+        self.ai_wait = 0
+        self.create_ai()
+        
+        # Optional network link to a remote opponent, whose turns arrive as inputs
+        self.network = network
+        
+        # Optional per-frame timing, shared with the world so it can time each step phase
+        self.profiler = profiler
+        self.world.profiler = profiler
+        
+        # Fonts
+        self.font = self.get_font(36)
+        self.small_font = self.get_font(24)
+        self.large_font = self.get_font(72)
+        self.text_cache = TextCache()
+        self.preview = TrajectoryPreview()
+        
+        # The view scrolls over the world, which is drawn shifted left by view_x
+        self.camera = Camera()
+        self.view_x = 0
+        
+        # Static scenery is composed from terrain chunks pre-rendered once each
+        self.background = None
+        self.background_x = None
+        self.background_version = 0  # Bumped whenever the background is recomposed
+        self.background_terrain = None
+        self.background_revision = None
+        self.background_damage = []  # Screen rects of the background repainted since the last frame
+        self.chunk_surfaces = OrderedDict()
+        self.spare_surfaces = []  # Chunk surfaces no longer in use, recycled instead of allocating
+        
+        # Optionally push only the changed parts of the screen each frame
+        self.dirty_rects = dirty_rects
+        self.dirty_tracker = DirtyRectTracker()
+        self.dirty_background = None
+    
+    def create_display(self, vsync):
+        """Open the game window, synced to the monitor refresh if requested, or reuse the open one"""
+        if pygame.display.get_init():
+            screen = pygame.display.get_surface()
+            if screen is not None and screen.get_size() == (SCREEN_WIDTH, SCREEN_HEIGHT) and vsync == Game.display_vsync:
+                return screen
+        else:
+            pygame.display.init()
+        Game.display_vsync = vsync
+        
+        if vsync:
+            try:
+                # Pygame only honours vsync for scaled or OpenGL displays
+                return pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SCALED, vsync=1)
+            except pygame.error:
+                print("Vsync is not available, falling back to a normal window")
+        return pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    
+    @classmethod
+    def get_font(cls, size):
+        """Get the default font at size, loading it once per process"""
+        if not pygame.font.get_init():
+            pygame.font.init()
+            cls.fonts.clear()  # Fonts loaded before pygame.quit() can't be used again
+        font = cls.fonts.get(size)
+        if font is None:
+            font = cls.fonts[size] = pygame.font.Font(None, size)
+        return font
+    
+    @classmethod
+    def get_game_over_overlay(cls):
+        """Get the translucent game over layer, building it once"""
+        if cls.game_over_overlay is None:
+            cls.game_over_overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+            cls.game_over_overlay.set_alpha(128)
+            cls.game_over_overlay.fill(BLACK)
+        return cls.game_over_overlay
+    
+    def handle_events(self):
+        """Handle all game events"""
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return False
+            
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3 and self.profiler is not None:
+                self.profiler.show_overlay = not self.profiler.show_overlay
+            
+            if self.world.game_over:
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_r and self.network is None:
+                        self.restart_game()
                 continue
             
-            arrow.update(wind_force)
+            if self.playback is not None or self.is_ai_turn() or self.is_remote_turn():
+                continue  # Replays and the AI's and remote player's turns ignore live input
             
-            # Check terrain collision
-            if arrow.y >= self.terrain.get_height_at_x(arrow.x):
-                arrow.active = False
+            # Networked turns start from a settled world so both sides shoot from the same state
+            if self.network is not None and self.world.arrows and event.type in (pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN):
                 continue
             
-            # Check player collisions
-            arrow_rect = arrow.get_rect()
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                if event.button == 1:  # Left mouse button
+                    self.actions.append(Action(CHARGE, pos=self.get_mouse_world_pos()))
             
-            # Check collision with player 1 (only if arrow was not shot by player 1)
-            if (arrow.shooter_id != 1 and 
-                (arrow_rect.colliderect(self.player1.get_head_rect()) or 
-                 arrow_rect.colliderect(self.player1.get_body_rect()))):
-                
-                # Determine if it's a headshot
-                if arrow_rect.colliderect(self.player1.get_head_rect()):
-                    self.player1.take_damage(HEAD_DAMAGE)
-                    self.create_blood_effect(self.player1.x, self.player1.y - 40, True)
-                else:
-                    self.player1.take_damage(BODY_DAMAGE)
-                    self.create_blood_effect(self.player1.x, self.player1.y - 20, False)
-                
-                arrow.active = False
-                self.check_game_over()
+            elif event.type == pygame.MOUSEBUTTONUP:
+                if event.button == 1:
+                    self.actions.append(Action(RELEASE, pos=self.get_mouse_world_pos(), arrow=self.arrow))
             
-            # Check collision with player 2 (only if arrow was not shot by player 2)
-            elif (arrow.shooter_id != 2 and 
-                  (arrow_rect.colliderect(self.player2.get_head_rect()) or 
-                   arrow_rect.colliderect(self.player2.get_body_rect()))):
-                
-                # Determine if it's a headshot
-                if arrow_rect.colliderect(self.player2.get_head_rect()):
-                    self.player2.take_damage(HEAD_DAMAGE)
-                    self.create_blood_effect(self.player2.x, self.player2.y - 40, True)
-                else:
-                    self.player2.take_damage(BODY_DAMAGE)
-                    self.create_blood_effect(self.player2.x, self.player2.y - 20, False)
-                
-                arrow.active = False
-                self.check_game_over()
-        
-        # Remove inactive arrows
-        self.arrows = [arrow for arrow in self.arrows if arrow.active]
-    
-    def check_game_over(self):
-        """Check if the game is over"""
-        if not self.player1.is_alive():
-            self.game_over = True
-            self.winner = 2
-        elif not self.player2.is_alive():
-            self.game_over = True
-            self.winner = 1
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    self.actions.append(Action(SKIP))
+                elif pygame.K_1 <= event.key < pygame.K_1 + len(self.world.arrow_table):
+                    self.arrow = event.key - pygame.K_1
+        
+        return True
     
     def restart_game(self):
-        """Restart the game"""
-        self.__init__()
+        """Start a new match in the same window, keeping fonts, sprites and surfaces"""
+        self.save_replay()
+        self.world = self.playback.create_world() if self.playback else World(None, self.player_count, self.team_count)
+        self.world.profiler = self.profiler
+        self.actions = []
+        self.camera = Camera()
+        self.view_x = 0
+        self.background_x = None  # Recompose the background from the new terrain
+        self.create_ai()
+    
+    def get_mouse_world_pos(self):
+        """Get the mouse position in world coordinates"""
+        mouse_x, mouse_y = pygame.mouse.get_pos()
+        return mouse_x + self.view_x, mouse_y
+    
+    def create_ai(self):
+        """Create the AI opponents for the current world, seeded from it"""
+        if self.ai_difficulty is not None:
+            seed = self.world.seed
+            self.ais = {player_id: AIArcher(player_id, self.ai_difficulty, random.Random(f"{seed}:{player_id}"))
+                        for player_id in range(2, len(self.world.players) + 1)}
+            self.ai_wait = 0
+    
+    def is_ai_turn(self):
+        """Check if an AI opponent is the one to shoot"""
+        return self.world.current_player in self.ais
+    
+    def is_remote_turn(self):
+        """Check if the networked opponent is the one to shoot"""
+        return self.network is not None and self.world.current_player != self.network.player_id
+    
+    def step_world(self):
+        """Advance the world one step with the queued input or the replay's input"""
+        if self.playback is not None:
+            self.world.step(self.playback.actions_at(self.world.frame))
+            self.camera.follow(self.world)
+            return
+        
+        # The AI waits for the last arrow to land, then pauses briefly before shooting
+        if self.is_ai_turn() and self.world.is_settled() and not self.world.game_over:
+            self.ai_wait += 1
+            if self.ai_wait >= AI_THINK_FRAMES:
+                self.actions.append(self.ais[self.world.current_player].get_action(self.world))
+                self.ai_wait = 0
+        
+        if self.network is not None:
+            self.step_network()
+        else:
+            self.world.step(self.actions)
+        self.actions = []
+        self.camera.follow(self.world)
+    
+    def step_network(self):
+        """Step a networked match, exchanging each turn's input in lockstep
+        
+        A turn's input is applied once the previous arrows have landed, on
+        both sides, so each simulates the same match without sending state.
+        """
+        world = self.world
+        turn = world.turn
+        remote = self.is_remote_turn()
+        if remote and not world.arrows and not world.game_over:
+            action = self.network.get_input(turn)
+            if action is not None:
+                self.actions.append(action)
+        
+        shots = len(world.shots)
+        world.step(self.actions)
+        
+        # Send the local turn as the exact shot the world fired, or a skip
+        if not remote and world.turn != turn:
+            if len(world.shots) > shots:
+                shot = world.shots[-1]
+                self.network.send_input(turn, Action(SHOOT, angle=shot.angle, power=shot.power, arrow=shot.arrow))
+            else:
+                self.network.send_input(turn, Action(SKIP))
+    
+    def get_profile_counts(self):
+        """Count the live objects the profiler reports"""
+        arrows = self.world.arrows
+        return {
+            "arrows": len(arrows),
+            "particles": len(self.world.blood_particles),
+            "trail_points": arrows.get_trail_point_count(),
+        }
+    
+    def save_replay(self):
+        """Save the current match's replay if recording was requested"""
+        if self.record_path and self.playback is None and self.world.replay.events:
+            self.world.replay.save(self.record_path)
+    
+    def get_background(self):
+        """Get the static scenery for the view, composing it again only if the view or terrain changed"""
+        terrain = self.world.terrain
+        if self.background_terrain is not terrain:
+            self.spare_surfaces.extend(self.chunk_surfaces.values())
+            self.chunk_surfaces.clear()
+            self.background_x = None
+            self.background_terrain = terrain
+            self.background_revision = terrain.revision
+        elif self.background_revision != terrain.revision:
+            # Craters only repaint the columns they changed
+            for left, right in terrain.get_changes_since(self.background_revision):
+                self.repair_background(left, right)
+            self.background_revision = terrain.revision
+        
+        if self.background is None or self.background_x != self.view_x:
+            if self.background is None:
+                self.background = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+            # Only the chunks in view are rendered
+            first = self.view_x // TERRAIN_CHUNK_WIDTH
+            last = (self.view_x + SCREEN_WIDTH - 1) // TERRAIN_CHUNK_WIDTH
+            for index in range(first, last + 1):
+                self.background.blit(self.get_chunk_surface(index), (index * TERRAIN_CHUNK_WIDTH - self.view_x, 0))
+            self.background_x = self.view_x
+            self.background_version += 1
+        return self.background
+    
+    def get_chunk_surface(self, index):
+        """Get the scenery of one terrain chunk, rendering it on a miss"""
+        surface = self.chunk_surfaces.get(index)
+        if surface is not None:
+            self.chunk_surfaces.move_to_end(index)
+            return surface
+        
+        if self.spare_surfaces:
+            surface = self.spare_surfaces.pop()
+        else:
+            surface = pygame.Surface((TERRAIN_CHUNK_WIDTH, SCREEN_HEIGHT)).convert()
+        self.world.terrain.draw(surface, index * TERRAIN_CHUNK_WIDTH)  # Paints every pixel
+        self.chunk_surfaces[index] = surface
+        if len(self.chunk_surfaces) > CHUNK_SURFACE_CACHE:
+            self.spare_surfaces.append(self.chunk_surfaces.popitem(last=False)[1])
+        return surface
+    
+    def repair_background(self, left, right):
+        """Repaint world columns left to right in the cached chunk surfaces and the composed background"""
+        terrain = self.world.terrain
+        for index, surface in self.chunk_surfaces.items():
+            chunk_left = index * TERRAIN_CHUNK_WIDTH
+            terrain.draw(surface, chunk_left, (left - chunk_left, right - chunk_left))
+        
+        if self.background_x is not None:
+            screen_left = max(left - self.background_x, 0)
+            screen_right = min(right - self.background_x, SCREEN_WIDTH)
+            if screen_left < screen_right:
+                terrain.draw(self.background, self.background_x, (screen_left, screen_right))
+                if self.dirty_rects:
+                    self.background_damage.append(pygame.Rect(screen_left, 0, screen_right - screen_left, SCREEN_HEIGHT))
     
     def draw_ui(self):
         """Draw all UI elements"""
         # Health bars
-        self.draw_health_bar(50, 50, self.player1.health, "Player 1")
-        self.draw_health_bar(SCREEN_WIDTH - 250, 50, self.player2.health, "Player 2")
+        for player_id in range(1, len(self.world.players) + 1):
+            self.draw_player_health(player_id)
         
         # Wind indicator
         self.draw_wind_indicator()
         
         # Current player indicator
-        current_text = f"Player {self.current_player}'s Turn"
-        text_surface = self.font.render(current_text, True, BLACK)
-        text_rect = text_surface.get_rect(center=(SCREEN_WIDTH // 2, 30))
-        self.screen.blit(text_surface, text_rect)
+        self.draw_turn_indicator()
+        
+        # Chosen arrow type
+        self.draw_arrow_indicator()
         
         # Charging bar
-        if self.charging:
+        if self.world.charging:
             self.draw_charging_bar()
         
+        # Connection status
+        if self.network is not None:
+            self.draw_network_status()
+        
         # Game over screen
-        if self.game_over:
+        if self.world.game_over:
             self.draw_game_over()
     
+    def get_health_rect(self, player_id):
+        """Get the screen area of a player's health display
+        
+        Two players get a large bar in each top corner. With more, each
+        player has a small tag over their head that moves with the view.
+        """
+        if len(self.world.players) == 2:
+            return pygame.Rect(50 if player_id == 1 else SCREEN_WIDTH - 250, 50, 200, 46)
+        player = self.world.players[player_id - 1]
+        left = int(player.x) - self.view_x - HEALTH_TAG_WIDTH // 2
+        return pygame.Rect(left, int(player.y) - 106, HEALTH_TAG_WIDTH, 30)
+    
+    def draw_player_health(self, player_id):
+        """Draw a player's health bar or, with more than two players, their health tag"""
+        health = self.world.players[player_id - 1].health
+        rect = self.get_health_rect(player_id)
+        if len(self.world.players) == 2:
+            self.draw_health_bar(rect.x, rect.y, health, f"Player {player_id}")
+            return
+        
+        label = f"P{player_id}"
+        if self.world.team_count:
+            label += f" T{self.world.get_team(player_id)}"
+        label_surface = self.text_cache.render(self.small_font, label, BLACK)
+        self.screen.blit(label_surface, label_surface.get_rect(midtop=(rect.centerx, rect.top)))
+        
+        bar_rect = pygame.Rect(rect.x, rect.bottom - 8, rect.width, 8)
+        pygame.draw.rect(self.screen, RED, bar_rect)
+        pygame.draw.rect(self.screen, GREEN, (bar_rect.x, bar_rect.y, bar_rect.width * health // PLAYER_HEALTH, 8))
+        pygame.draw.rect(self.screen, BLACK, bar_rect, 1)
+    
     def draw_health_bar(self, x, y, health, label):
         """Draw a health bar for a player"""
         # Label
-        label_surface = self.small_font.render(label, True, BLACK)
+        label_surface = self.text_cache.render(self.small_font, label, BLACK)
         self.screen.blit(label_surface, (x, y))
         
         # Health bar background
@@ -536,15 +2479,15 @@ class Game:
         
         # Health text
         health_text = f"{health}/{PLAYER_HEALTH}"
-        health_surface = self.small_font.render(health_text, True, BLACK)
+        health_surface = self.text_cache.render(self.small_font, health_text, BLACK)
         text_rect = health_surface.get_rect(center=(x + 100, y + 35))
         self.screen.blit(health_surface, text_rect)
     
     def draw_wind_indicator(self):
         """Draw wind strength and direction indicator with custom arrow"""
         # Draw wind text
-        wind_text = f"Wind: {self.wind_strength:.1f}"
-        wind_surface = self.font.render(wind_text, True, BLACK)
+        wind_text = f"Wind: {self.world.wind_strength:.1f}"
+        wind_surface = self.text_cache.render(self.font, wind_text, BLACK)
         wind_rect = wind_surface.get_rect(center=(SCREEN_WIDTH // 2, 70))
         self.screen.blit(wind_surface, wind_rect)
         
@@ -552,7 +2495,7 @@ class Game:
         arrow_x = wind_rect.right + 10
         arrow_y = wind_rect.centery
         
-        if self.wind_direction > 0:  # Right arrow
+        if self.world.wind_direction > 0:  # Right arrow
             # Draw right-pointing triangle
             arrow_points = [
                 (arrow_x, arrow_y),
@@ -579,7 +2522,7 @@ class Game:
     
     def draw_charging_bar(self):
         """Draw the power charging bar"""
-        if not self.charging:
+        if not self.world.charging:
             return
         
         # Charging bar background
@@ -589,13 +2532,13 @@ class Game:
         pygame.draw.rect(self.screen, GRAY, bar_rect)
         
         # Charging bar fill
-        charge_width = int((self.charge_power / MAX_POWER) * 200)
+        charge_width = int((self.world.charge_power / MAX_POWER) * 200)
         charge_rect = pygame.Rect(bar_x, bar_y, charge_width, 30)
         
         # Color changes based on power level
-        if self.charge_power < MAX_POWER * 0.3:
+        if self.world.charge_power < MAX_POWER * 0.3:
             color = GREEN
-        elif self.charge_power < MAX_POWER * 0.7:
+        elif self.world.charge_power < MAX_POWER * 0.7:
             color = YELLOW
         else:
             color = RED
@@ -604,83 +2547,339 @@ class Game:
         pygame.draw.rect(self.screen, BLACK, bar_rect, 2)
         
         # Power text
-        power_text = f"Power: {int((self.charge_power / MAX_POWER) * 100)}%"
-        power_surface = self.small_font.render(power_text, True, BLACK)
+        power_text = f"Power: {int((self.world.charge_power / MAX_POWER) * 100)}%"
+        power_surface = self.text_cache.render(self.small_font, power_text, BLACK)
         text_rect = power_surface.get_rect(center=(SCREEN_WIDTH // 2, bar_y - 20))
         self.screen.blit(power_surface, text_rect)
     
     def draw_game_over(self):
         """Draw game over screen"""
         # Semi-transparent overlay
-        overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-        overlay.set_alpha(128)
-        overlay.fill(BLACK)
-        self.screen.blit(overlay, (0, 0))
+        self.screen.blit(self.get_game_over_overlay(), (0, 0))
         
         # Game over text
-        game_over_text = f"Player {self.winner} Wins!"
-        game_over_surface = pygame.font.Font(None, 72).render(game_over_text, True, WHITE)
+        if self.world.winner is None:
+            game_over_text = "Draw!"
+        elif self.world.team_count:
+            game_over_text = f"Team {self.world.winner} Wins!"
+        else:
+            game_over_text = f"Player {self.world.winner} Wins!"
+        game_over_surface = self.text_cache.render(self.large_font, game_over_text, WHITE)
         game_over_rect = game_over_surface.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 50))
         self.screen.blit(game_over_surface, game_over_rect)
         
         # Restart instruction
         restart_text = "Press R to Restart"
-        restart_surface = self.font.render(restart_text, True, WHITE)
+        restart_surface = self.text_cache.render(self.font, restart_text, WHITE)
         restart_rect = restart_surface.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 50))
         self.screen.blit(restart_surface, restart_rect)
     
-    def draw(self):
-        """Draw everything on screen"""
-        # Clear screen
-        self.screen.fill(WHITE)
+    def get_draw_elements(self):
+        """Describe this frame as (name, signature, rects, draw) in draw order"""
+        world = self.world
+        elements = []
+        view_x = self.view_x
+        
+        # World objects are positioned in world space, so their rects move with the view
+        for player_id, player in enumerate(world.players, 1):
+            elements.append((f"player{player_id}", (player.x, player.y, player.facing_right),
+                             [player.get_draw_rect().move(-view_x, 0)],
+                             lambda player=player: player.draw(self.screen, view_x)))
+        
+        if world.arrows:
+            elements.append(("arrows", None, [rect.move(-view_x, 0) for rect in world.arrows.get_draw_rects()],
+                             lambda: world.arrows.draw(self.screen, self.interpolation, view_x)))
+        
+        particles_rect = world.blood_particles.get_draw_rect()
+        if particles_rect is not None:
+            elements.append(("particles", None, [particles_rect.move(-view_x, 0)],
+                             lambda: world.blood_particles.draw(self.screen, self.interpolation, view_x)))
+        
+        # HUD entries use fixed boxes that cover their largest text
+        for player_id, player in enumerate(world.players, 1):
+            elements.append((f"health{player_id}", player.health, [self.get_health_rect(player_id)],
+                             lambda player_id=player_id: self.draw_player_health(player_id)))
+        elements.append(("wind", (world.wind_strength, world.wind_direction),
+                         [pygame.Rect(SCREEN_WIDTH // 2 - 120, 52, 240, 36)], self.draw_wind_indicator))
+        elements.append(("turn", world.current_player,
+                         [pygame.Rect(SCREEN_WIDTH // 2 - 200, 12, 400, 36)], self.draw_turn_indicator))
+        elements.append(("arrow", self.arrow,
+                         [pygame.Rect(SCREEN_WIDTH // 2 - 150, 92, 300, 26)], self.draw_arrow_indicator))
+        
+        if world.charging:
+            elements.append(("charge", world.charge_power,
+                             [pygame.Rect(SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT - 135, 200, 66)],
+                             self.draw_charging_bar))
+        
+        if self.network is not None:
+            elements.append(("network", self.get_network_status(),
+                             [pygame.Rect(10, SCREEN_HEIGHT - 34, 260, 24)], self.draw_network_status))
+        
+        if world.game_over:
+            # Wrapped so a draw, with no winner, isn't taken for an entry that changes every frame
+            elements.append(("game_over", (world.winner,), [self.screen.get_rect()], self.draw_game_over))
+        
+        if self.profiler is not None and self.profiler.show_overlay:
+            elements.append(("profiler", self.profiler.overlay_version, [self.profiler.get_overlay_rect()],
+                             lambda: self.profiler.draw(self.screen, self.small_font)))
+        
+        if world.charging and world.charge_start_pos:
+            arc = self.get_preview_arc()
+            elements.append(("preview", arc[0], [arc[1].move(-view_x, 0)], lambda: self.draw_trajectory_preview(arc)))
+            
+            start, end = self.get_aim_line()
+            aim_rect = pygame.Rect(min(start[0], end[0]), min(start[1], end[1]),
+                                   abs(end[0] - start[0]) + 1, abs(end[1] - start[1]) + 1).inflate(4, 4)
+            elements.append(("aim", (start, end), [aim_rect], self.draw_aim_line))
         
-        # Draw terrain
-        self.terrain.draw(self.screen)
+        return elements
+    
+    def draw_turn_indicator(self):
+        """Draw whose turn it is"""
+        current_text = f"Player {self.world.current_player}'s Turn"
+        if self.world.team_count:
+            current_text += f" (Team {self.world.get_team(self.world.current_player)})"
+        text_surface = self.text_cache.render(self.font, current_text, BLACK)
+        text_rect = text_surface.get_rect(center=(SCREEN_WIDTH // 2, 30))
+        self.screen.blit(text_surface, text_rect)
+    
+    def draw_arrow_indicator(self):
+        """Draw the chosen arrow type and the keys that change it"""
+        table = self.world.arrow_table
+        arrow_text = f"Arrow: {table.names[self.arrow]}"
+        if len(table) > 1:
+            arrow_text += f" (keys 1-{len(table)})"
+        text_surface = self.text_cache.render(self.small_font, arrow_text, BLACK)
+        text_rect = text_surface.get_rect(center=(SCREEN_WIDTH // 2, 105))
+        self.screen.blit(text_surface, text_rect)
+    
+    def get_network_status(self):
+        """Get the connection status line of a networked match"""
+        network = self.network
+        if not network.connected:
+            return "Opponent disconnected"
+        if network.latency is None:
+            return f"Player {network.player_id} - measuring ping"
+        return f"Player {network.player_id} - ping {network.latency * 1000:.0f} ms"
+    
+    def draw_network_status(self):
+        """Draw the connection status in the bottom left corner"""
+        text_surface = self.text_cache.render(self.small_font, self.get_network_status(), BLACK)
+        self.screen.blit(text_surface, (10, SCREEN_HEIGHT - 30))
+    
+    def get_aim_line(self):
+        """Get the start and end of the aiming line on screen"""
+        current_player_obj = self.world.get_current_player()
+        start = (int(current_player_obj.x) - self.view_x, int(current_player_obj.y - ARROW_START_HEIGHT))
+        return start, pygame.mouse.get_pos()
+    
+    def get_preview_arc(self):
+        """Get the predicted arc of the shot being charged, in world coordinates"""
+        angle = self.world.get_aim_angle(self.get_mouse_world_pos())
+        return self.preview.get_arc(self.world, angle, self.world.charge_power, self.arrow)
+    
+    def draw_trajectory_preview(self, arc=None):
+        """Draw the predicted flight of the shot being charged"""
+        points, _ = arc or self.get_preview_arc()
+        view_x = self.view_x
+        pygame.draw.lines(self.screen, GRAY, False, [(x - view_x, y) for x, y in points], 2)
+    
+    def draw_aim_line(self):
+        """Draw aiming line from the current player to the mouse"""
+        start, end = self.get_aim_line()
+        pygame.draw.line(self.screen, RED, start, end, 2)
+    
+    def draw(self, interpolation=1.0):
+        """Draw everything on screen, blending moving objects between steps"""
+        self.interpolation = interpolation
+        self.view_x = self.camera.get_offset(interpolation)
+        if self.dirty_rects:
+            self.draw_dirty()
+            return
+        
+        profiler = self.profiler
+        
+        # Clear screen and draw terrain with a single blit
+        self.screen.blit(self.get_background(), (0, 0))
+        if profiler is not None:
+            profiler.mark("draw_background")
         
         # Draw players
-        self.player1.draw(self.screen)
-        self.player2.draw(self.screen)
+        for player in self.world.players:
+            player.draw(self.screen, self.view_x)
+        if profiler is not None:
+            profiler.mark("draw_players")
         
         # Draw arrows
-        for arrow in self.arrows:
-            arrow.draw(self.screen)
+        self.world.arrows.draw(self.screen, interpolation, self.view_x)
+        if profiler is not None:
+            profiler.mark("draw_arrows")
         
         # Draw blood particles
-        for particle in self.blood_particles:
-            particle.draw(self.screen)
+        self.world.blood_particles.draw(self.screen, interpolation, self.view_x)
+        if profiler is not None:
+            profiler.mark("draw_particles")
         
         # Draw UI
         self.draw_ui()
         
-        # Draw aiming line when charging
-        if self.charging and self.charge_start_pos:
-            current_player_obj = self.player1 if self.current_player == 1 else self.player2
-            mouse_pos = pygame.mouse.get_pos()
-            pygame.draw.line(self.screen, RED, 
-                           (current_player_obj.x, current_player_obj.y - 20), 
-                           mouse_pos, 2)
+        # Draw the predicted arc and aiming line when charging
+        if self.world.charging and self.world.charge_start_pos:
+            self.draw_trajectory_preview()
+            self.draw_aim_line()
+        
+        if profiler is not None:
+            profiler.mark("draw_ui")
+            if profiler.show_overlay:
+                profiler.draw(self.screen, self.small_font)
+                profiler.mark("draw_overlay")
         
         pygame.display.flip()
+        if profiler is not None:
+            profiler.mark("present")
+    
+    def draw_dirty(self):
+        """Repaint and push only the parts of the screen that changed"""
+        background = self.get_background()
+        elements = self.get_draw_elements()
+        
+        damage = self.background_damage
+        self.background_damage = []
+        
+        # A new background invalidates everything on screen
+        if self.dirty_background != self.background_version:
+            self.dirty_background = self.background_version
+            self.dirty_tracker.reset()
+            self.screen.blit(background, (0, 0))
+            self.dirty_tracker.plan([element[:3] for element in elements])
+            for element in elements:
+                element[3]()
+            if self.profiler is not None:
+                self.profiler.mark("draw_dirty")
+            pygame.display.flip()
+            if self.profiler is not None:
+                self.profiler.mark("present")
+            return
+        
+        redraw, dirty = self.dirty_tracker.plan([element[:3] for element in elements], damage)
+        if not dirty:
+            if self.profiler is not None:
+                self.profiler.mark("draw_dirty")
+            return
+        
+        for rect in dirty:
+            self.screen.blit(background, rect, rect)
+        for name, _, _, draw in elements:
+            if name in redraw:
+                draw()
+        if self.profiler is not None:
+            self.profiler.mark("draw_dirty")
+        
+        pygame.display.update(dirty)
+        if self.profiler is not None:
+            self.profiler.mark("present")
     
     def run(self):
         """Main game loop"""
         running = True
+        accumulator = 0.0
+        previous_time = time.perf_counter()
         
         while running:
+            profiler = self.profiler
+            if profiler is not None:
+                profiler.begin_frame()
+            
+            # Clamp long stalls so the simulation doesn't spiral trying to catch up
+            now = time.perf_counter()
+            accumulator += min(now - previous_time, MAX_FRAME_TIME)
+            previous_time = now
+            
             running = self.handle_events()
+            if profiler is not None:
+                profiler.mark("events")
             
-            if not self.game_over:
-                self.update_charging()
-                self.update_arrows()
-                self.update_blood_particles()  # Update blood particles
+            # Advance the simulation in fixed steps, however long the frame took
+            while accumulator >= SIM_STEP:
+                self.step_world()
+                accumulator -= SIM_STEP
             
-            self.draw()
-            self.clock.tick(FPS)
-        
+            # Draw between the last two steps using the leftover time
+            self.draw(accumulator / SIM_STEP)
+            self.clock.tick(self.fps_limit)
+            if profiler is not None:
+                profiler.mark("wait")
+                profiler.end_frame(self.get_profile_counts())
+        
+        self.save_replay()
+        if self.profiler is not None:
+            self.profiler.close()
         pygame.quit()
         sys.exit()
 
+def fast_forward(replay):
+    """Re-simulate a replay without a display and report how it ended"""
+    start = time.perf_counter()
+    world = replay.simulate()
+    elapsed = time.perf_counter() - start
+    
+    real_time = replay.end_frame * SIM_STEP
+    print(f"Replayed {replay.end_frame} steps ({real_time:.1f}s of play) in {elapsed:.3f}s, "
+          f"{real_time / max(elapsed, 1e-9):.0f}x real time")
+    health = ", ".join(f"Player {player_id} {player.health} HP" for player_id, player in enumerate(world.players, 1))
+    print(f"Seed {replay.seed}: {health}")
+    if world.game_over:
+        print(f"{'Team' if world.team_count else 'Player'} {world.winner} wins" if world.winner else "Draw")
+
+def main():
+    """Parse command line options and run the game"""
+    parser = argparse.ArgumentParser(description="Stickman Archery Game")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="only push changed screen regions (saves CPU on slow machines)")
+    parser.add_argument("--fps", type=int, default=FPS,
+                        help="frame rate cap for rendering, 0 for uncapped (default: %(default)s)")
+    parser.add_argument("--vsync", action="store_true",
+                        help="sync rendering to the monitor refresh rate instead of capping it")
+    parser.add_argument("--seed", type=int,
+                        help="seed for terrain and wind so a match can be reproduced")
+    parser.add_argument("--record", metavar="PATH",
+                        help="save a replay of the latest match to PATH")
+    parser.add_argument("--replay", metavar="PATH",
+                        help="play back a recorded match instead of taking input")
+    parser.add_argument("--fast", action="store_true",
+                        help="with --replay, re-simulate headlessly as fast as possible and print the result")
+    parser.add_argument("--ai", choices=sorted(AI_DIFFICULTIES), metavar="DIFFICULTY",
+                        help="play against computer opponents: easy, medium or hard")
+    parser.add_argument("--players", type=int, default=2, choices=range(2, MAX_PLAYERS + 1), metavar="N",
+                        help="number of archers, 2 to %d (default: %%(default)s)" % MAX_PLAYERS)
+    parser.add_argument("--teams", type=int, metavar="N",
+                        help="split the archers into N teams instead of playing free-for-all")
+    parser.add_argument("--profile", action="store_true",
+                        help="show frame timings on screen (toggle with F3)")
+    parser.add_argument("--profile-output", metavar="PATH",
+                        help="write per-frame timings to PATH as CSV, or JSON lines for .json/.jsonl")
+    args = parser.parse_args()
+    
+    profiler = None
+    if args.profile or args.profile_output:
+        profiler = FrameProfiler(args.profile_output, show_overlay=args.profile)
+    
+    playback = Replay.load(args.replay) if args.replay else None
+    if playback is not None and args.fast:
+        fast_forward(playback)
+        return
+    
+    if args.teams is not None and not 2 <= args.teams <= args.players:
+        parser.error("--teams must be from 2 up to the number of players")
+    if args.seed is not None and not 0 <= args.seed < 2 ** 32:
+        parser.error("--seed must be from 0 up to 2**32 - 1")
+    
+    fps_limit = 0 if args.vsync else args.fps
+    game = Game(dirty_rects=args.dirty_rects, fps_limit=fps_limit, vsync=args.vsync,
+                seed=args.seed, playback=playback, record_path=args.record, profiler=profiler,
+                ai_difficulty=args.ai, player_count=args.players, team_count=args.teams)
+    game.run()
+
 # Run the game
 if __name__ == "__main__":
-    game = Game()
-    game.run()
+    main()